@@ -0,0 +1,471 @@
+# Бенчмарки REST API. Запуск: python bench.py <сценарий> [параметры]
+# База берётся из DATABASE_URL, по умолчанию создаётся временный файл,
+# чтобы не трогать OSport.db
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import event, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import server
+from server import Competitions, Results, Users, results_repo
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    def pick(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": pick(0.50) * 1000,
+        "p95_ms": pick(0.95) * 1000,
+        "p99_ms": pick(0.99) * 1000,
+    }
+
+
+async def timed_requests(client, method, url, n, **kwargs):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        samples.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return samples
+
+
+# Старый вариант get_db: create_all на каждый запрос
+async def legacy_get_db():
+    async with server.engine.begin() as conn:
+        await conn.run_sync(server.Base.metadata.create_all)
+
+    db = server.ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+# Задержка запроса /chekUser с create_all в get_db и без него
+async def bench_get_db(args):
+    report = {}
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app = server.app)
+        async with httpx.AsyncClient(transport = transport, base_url = "http://bench") as client:
+            params = {"telegram_id": 1}
+            await timed_requests(client, "GET", "/chekUser", 10, params = params)
+
+            server.app.dependency_overrides[server.get_read_db] = legacy_get_db
+            report["before"] = percentiles(await timed_requests(client, "GET", "/chekUser", args.requests, params = params))
+            server.app.dependency_overrides.clear()
+            report["after"] = percentiles(await timed_requests(client, "GET", "/chekUser", args.requests, params = params))
+    return report
+
+
+# Наполнение БД: у каждого из первых юзеров по результату в каждом соревновании
+async def seed(users, competitions, results, chunk = 10000):
+    results = min(results, users * competitions)
+    async with server.engine.begin() as conn:
+        for start in range(0, users, chunk):
+            await conn.execute(insert(Users), [
+                {
+                    "telegram_id": telegram_id,
+                    "telegram_link": f"@user{telegram_id}",
+                    "first_name": "Bench",
+                    "last_name": "User",
+                    "birth_date": date(2000, 1, 1),
+                    "sex": "M",
+                }
+                for telegram_id in range(start + 1, min(start + chunk, users) + 1)
+            ])
+        await conn.execute(insert(Competitions), [
+            {"title": f"Competition {n}", "password": "", "video_instruction": ""}
+            for n in range(competitions)
+        ])
+        for start in range(0, results, chunk):
+            await conn.execute(insert(Results), [
+                {
+                    "competition_id": n % competitions + 1,
+                    "telegram_id": n // competitions + 1,
+                    "video": "",
+                    "count": n * 7919 % 100,
+                    "status": "✅",
+                }
+                for n in range(start, min(start + chunk, results))
+            ])
+
+
+# Вызовы, которые делают эндпоинты, фильтрующие results: те же функции
+# репозитория и та же постраничная выдача server.keyset, что и в server.py
+def endpoint_calls(competition_id = 1, telegram_id = 1):
+    def page(query, after_id):
+        return lambda db: db.execute(server.keyset(query, Results.result_id, after_id, 50))
+    return {
+        "/getUserResult": lambda db: results_repo.get_user(db, competition_id, telegram_id),
+        "/chekStatus": lambda db: results_repo.check_status(db, competition_id, telegram_id),
+        "/editResult": lambda db: results_repo.edit(db, competition_id, telegram_id, {"video": "", "count": 1, "status": "✅"}),
+        "/editCountResult": lambda db: results_repo.edit_count(db, 1, 1),
+        "/getCompetitionMembers": lambda db: results_repo.competition_members(db, competition_id),
+        "/getCompetitionResult": page(results_repo.list_query(competition_id = competition_id), None),
+        "/getCompetitionResult?after_id": page(results_repo.list_query(competition_id = competition_id), 100),
+        "/getUserAll": page(results_repo.list_query(telegram_id = telegram_id), None),
+        "/getUserAll?after_id": page(results_repo.list_query(telegram_id = telegram_id), 100),
+        "/raitingUsers": lambda db: results_repo.load(db, [1, 2, 3]),
+    }
+
+
+# Шаги плана, которые растут с размером таблицы или соревнования: полный
+# просмотр results, сортировка во временном B-дереве и перебор по диапазону
+# rowid (фильтр проверяется на каждой строке после after_id)
+def slow_steps(plan, sqlite):
+    if sqlite:
+        return [step for step in plan if step.startswith("SCAN results") or "USE TEMP B-TREE" in step
+                or "INTEGER PRIMARY KEY (rowid>" in step or "INTEGER PRIMARY KEY (rowid<" in step]
+    return [step for step in plan if "Seq Scan on results" in step or step.lstrip(" ->").startswith("Sort")]
+
+
+# Проверка планов: ни один запрос эндпоинта не должен сканировать results целиком
+# или сортировать её. SQL перехватывается при выполнении вызова (изменения
+# откатываются) и разбирается через EXPLAIN QUERY PLAN (SQLite) или EXPLAIN (Postgres)
+async def check_plans(args):
+    report = {}
+    failed = False
+    sqlite = server.engine.dialect.name == "sqlite"
+    async with server.app.router.lifespan_context(server.app):
+        async with server.engine.connect() as conn:
+            for endpoint, call in endpoint_calls().items():
+                statements = []
+
+                def capture(connection, cursor, statement, parameters, context, executemany):
+                    if not statement.startswith("EXPLAIN"):
+                        statements.append((statement, parameters))
+
+                event.listen(conn.sync_connection, "before_cursor_execute", capture)
+                try:
+                    async with AsyncSession(bind = conn) as db:
+                        await call(db)
+                        await db.rollback()
+                finally:
+                    event.remove(conn.sync_connection, "before_cursor_execute", capture)
+
+                plan = []
+                for statement, parameters in statements:
+                    if sqlite:
+                        plan += [row[-1] for row in await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+                    else:
+                        plan += [row[0] for row in await conn.exec_driver_sql("EXPLAIN " + statement, parameters)]
+                slow = slow_steps(plan, sqlite)
+                failed = failed or bool(slow)
+                report[endpoint] = {"plan": plan, "slow_steps": slow}
+                await conn.rollback()
+    report["ok"] = not failed
+    return report
+
+
+# Задержка эндпоинтов на большой таблице results
+async def bench_indexes(args):
+    report = {}
+    async with server.app.router.lifespan_context(server.app):
+        start = time.perf_counter()
+        await seed(args.users, args.competitions, args.results)
+        report["seed_seconds"] = time.perf_counter() - start
+
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app = server.app)
+        async with httpx.AsyncClient(transport = transport, base_url = "http://bench") as client:
+            member = {"competition_id": 1, "telegram_id": 1}
+            for url, params in [
+                ("/getUserResult", member),
+                ("/chekStatus", member),
+                ("/getUserAll", {"telegram_id": 1}),
+                ("/getCompetitionMembers", {"competition_id": 1}),
+                ("/raitingUsers", {"competition_id": 1, "limit": 10}),
+            ]:
+                report[url] = percentiles(await timed_requests(client, "GET", url, args.requests, params = params))
+    return report
+
+
+# Движки для сравнения: прежний (журнал по умолчанию, общий пул на запись
+# и чтение) и текущий (WAL, один писатель, пул читателей). У каждого профиля
+# своя база, так как режим WAL сохраняется в файле
+def engine_profiles(directory):
+    url = "sqlite+aiosqlite:///" + os.path.join(directory, "legacy.db")
+    legacy = create_async_engine(url, connect_args = {"check_same_thread": False})
+    url = "sqlite+aiosqlite:///" + os.path.join(directory, "tuned.db")
+    return {
+        "legacy": (legacy, legacy),
+        "tuned": (server.sqlite_engine(url, 1, server.SQLITE_PRAGMAS),
+                  server.sqlite_engine(url, server.SQLITE_READERS, {**server.SQLITE_PRAGMAS, "query_only": "ON"})),
+    }
+
+
+# Одновременные записи (/addResult, /editCountResult) и чтения (/getCompetitionResult):
+# задержки и число ответов с ошибкой ("database is locked") для каждого профиля SQLite
+async def bench_contention(args):
+    report = {}
+    saved = server.engine, server.read_engine, server.SessionLocal, server.ReadSessionLocal
+    for name, (write_engine, read_engine) in engine_profiles(tempfile.mkdtemp()).items():
+        server.engine, server.read_engine = write_engine, read_engine
+        server.SessionLocal, server.ReadSessionLocal = async_sessionmaker(write_engine), async_sessionmaker(read_engine)
+        server.leaderboards.rebuild([])
+        await server.cache.backend.clear()
+
+        writes, reads, errors = [], [], []
+        async with server.app.router.lifespan_context(server.app):
+            await seed(args.writers * args.requests, 1, 0)
+            transport = httpx.ASGITransport(app = server.app)
+            async with httpx.AsyncClient(transport = transport, base_url = "http://bench", timeout = None) as client:
+                async def request(samples, method, url, **kwargs):
+                    start = time.perf_counter()
+                    response = await client.request(method, url, **kwargs)
+                    samples.append(time.perf_counter() - start)
+                    body = response.json()
+                    if response.status_code >= 400 or isinstance(body, dict) and "error" in body:
+                        errors.append(str(body)[:200])
+
+                async def writer(n):
+                    for i in range(args.requests):
+                        telegram_id = n * args.requests + i + 1
+                        await request(writes, "POST", "/addResult", json = {
+                            "competition_id": 1, "telegram_id": telegram_id, "video": "", "count": i, "status": "⏳"})
+                        await request(writes, "POST", "/editCountResult", params = {"result_id": telegram_id, "new_count": i + 1})
+
+                async def reader():
+                    for _ in range(args.requests):
+                        await request(reads, "GET", "/getCompetitionResult", params = {"competition_id": 1, "limit": 50})
+
+                start = time.perf_counter()
+                await asyncio.gather(*[writer(n) for n in range(args.writers)], *[reader() for _ in range(args.readers)])
+                seconds = time.perf_counter() - start
+        report[name] = {
+            "seconds": seconds,
+            "writes": percentiles(writes),
+            "reads": percentiles(reads),
+            "errors": len(errors),
+            "first_error": errors[0] if errors else None,
+        }
+    server.engine, server.read_engine, server.SessionLocal, server.ReadSessionLocal = saved
+    return report
+
+
+# Запросы смешанной нагрузки: название -> функция (генератор случайных
+# чисел, args) -> (метод, путь, параметры запроса, тело)
+WORKLOAD = {
+    "raitingUsers": lambda rnd, args: ("GET", "/raitingUsers", {
+        "competition_id": rnd.randint(1, args.competitions), "offset": rnd.choice((0, 0, 0, 50)), "limit": 50}, None),
+    "totalRaitingUsers": lambda rnd, args: ("GET", "/totalRaitingUsers", {"offset": 0, "limit": 50}, None),
+    "userRank": lambda rnd, args: ("GET", "/userRank", {
+        "competition_id": rnd.randint(1, args.competitions), "telegram_id": rnd.randint(1, args.users)}, None),
+    "chekStatus": lambda rnd, args: ("GET", "/chekStatus", {
+        "competition_id": rnd.randint(1, args.competitions), "telegram_id": rnd.randint(1, args.users)}, None),
+    "chekUser": lambda rnd, args: ("GET", "/chekUser", {"telegram_id": rnd.randint(1, args.users * 2)}, None),
+    "getUserResult": lambda rnd, args: ("GET", "/getUserResult", {
+        "competition_id": rnd.randint(1, args.competitions), "telegram_id": rnd.randint(1, args.users)}, None),
+    "editCountResult": lambda rnd, args: ("POST", "/editCountResult", {
+        "result_id": rnd.randint(1, max(1, args.results)), "new_count": rnd.randint(0, 100)}, None),
+    "editResult": lambda rnd, args: ("POST", "/editResult", {
+        "competition_id": 1, "telegram_id": rnd.randint(1, max(1, args.results // args.competitions))},
+        {"video": "", "count": rnd.randint(0, 100), "status": "✅"}),
+}
+
+# Доли запросов по умолчанию: в основном рейтинги и проверки статуса, немного записей
+DEFAULT_MIX = "raitingUsers=25,totalRaitingUsers=5,userRank=10,chekStatus=25,chekUser=15,getUserResult=10,editCountResult=7,editResult=3"
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in WORKLOAD:
+            raise SystemExit(f"Неизвестный запрос в --mix: {name}. Есть: {', '.join(WORKLOAD)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+# Сравнение с прошлым отчётом: p95 запроса не должен вырасти больше, чем на tolerance
+def compare_reports(report, baseline, tolerance):
+    regressions = {}
+    for name, current in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if before and current["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions[name] = {"before_p95_ms": before["p95_ms"], "after_p95_ms": current["p95_ms"]}
+    return regressions
+
+
+# Кодирование большого списка результатов в JSON: прежний путь (ORM-объекты
+# и jsonable_encoder), ORM-объекты через модель ответа, строки по колонкам сразу в JSON
+async def bench_encoding(args):
+    report = {}
+    async with server.app.router.lifespan_context(server.app):
+        await seed(args.users, args.competitions, args.results)
+        results_json = TypeAdapter(list[server.ResultOut])
+        ways = {
+            "orm_jsonable_encoder": (select(Results), lambda result: json.dumps(jsonable_encoder(result.scalars().all())).encode()),
+            "orm_response_model": (select(Results), lambda result: results_json.dump_json(results_json.validate_python(result.scalars().all()))),
+            "columns_dump_json": (select(*Results.__table__.c), lambda result: server.JSON.dump_json(server.as_dicts(result.all()))),
+        }
+        async with server.ReadSessionLocal() as db:
+            for name, (query, encode) in ways.items():
+                fetch_seconds = encode_seconds = 0.0
+                for _ in range(args.rounds):
+                    start = time.perf_counter()
+                    result = await db.execute(query.limit(args.results))
+                    middle = time.perf_counter()
+                    body = encode(result)
+                    fetch_seconds += middle - start
+                    encode_seconds += time.perf_counter() - middle
+                    db.expunge_all()
+                rows = args.rounds * args.results
+                report[name] = {"fetch_us_per_row": fetch_seconds / rows * 1e6, "encode_us_per_row": encode_seconds / rows * 1e6,
+                                "total_us_per_row": (fetch_seconds + encode_seconds) / rows * 1e6, "bytes": len(body)}
+
+        transport = httpx.ASGITransport(app = server.app)
+        async with httpx.AsyncClient(transport = transport, base_url = "http://bench") as client:
+            report["/getAllResult"] = percentiles(await timed_requests(client, "GET", "/getAllResult", args.rounds, params = {"limit": args.results}))
+    return report
+
+
+# Изменение count у --requests результатов: коммит на каждый вызов
+# репозитория, один коммит на все вызовы и один UPDATE ... CASE (edit_counts)
+async def bench_commits(args):
+    report = {}
+    async with server.app.router.lifespan_context(server.app):
+        await seed(args.users, args.competitions, args.results)
+        rnd = random.Random(args.seed)
+        result_ids = rnd.sample(range(1, args.results + 1), min(args.requests, args.results))
+
+        async def per_call(counts):
+            for result_id, count in counts.items():
+                async with server.unit_of_work() as uow:
+                    await server.results_repo.edit_count(uow.session, result_id, count)
+                    await uow.commit()
+
+        async def one_commit(counts):
+            async with server.unit_of_work() as uow:
+                for result_id, count in counts.items():
+                    await server.results_repo.edit_count(uow.session, result_id, count)
+                await uow.commit()
+
+        async def one_update(counts):
+            async with server.unit_of_work() as uow:
+                await server.results_repo.edit_counts(uow.session, counts)
+                await uow.commit()
+
+        ways = {"commit_per_call": per_call, "one_commit": one_commit, "edit_counts": one_update}
+        for round, (name, write) in enumerate(ways.items()):
+            counts = {result_id: rnd.randint(0, 100) + round for result_id in result_ids}
+            start = time.perf_counter()
+            await write(counts)
+            seconds = time.perf_counter() - start
+            report[name] = {"seconds": seconds, "us_per_row": seconds / len(counts) * 1e6}
+    return report
+
+
+# Смешанная нагрузка на приложение в процессе: --concurrency клиентов
+# выполняют --requests запросов в пропорциях --mix. Последовательность
+# запросов задаётся --seed, поэтому прогоны разных версий сравнимы
+async def bench_mixed(args):
+    weights = parse_mix(args.mix)
+    names, cumulative = list(weights), []
+    for weight in weights.values():
+        cumulative.append((cumulative[-1] if cumulative else 0) + weight)
+    rnd = random.Random(args.seed)
+    plan = [rnd.choices(names, cum_weights = cumulative)[0] for _ in range(args.requests)]
+    plan = [(name, WORKLOAD[name](rnd, args)) for name in plan]
+
+    report = {
+        "config": {key: getattr(args, key) for key in ("users", "competitions", "results", "requests", "concurrency", "mix", "seed")},
+        "database": server.engine.dialect.name,
+    }
+    async with server.app.router.lifespan_context(server.app):
+        start = time.perf_counter()
+        await seed(args.users, args.competitions, args.results)
+        report["seed_seconds"] = time.perf_counter() - start
+
+    samples = {name: [] for name in weights}
+    statuses = {}
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app = server.app)
+        async with httpx.AsyncClient(transport = transport, base_url = "http://bench", timeout = None) as client:
+            queue = iter(plan)
+
+            async def worker():
+                for name, (method, url, params, body) in queue:
+                    start = time.perf_counter()
+                    response = await client.request(method, url, params = params, json = body)
+                    samples[name].append(time.perf_counter() - start)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+            seconds = time.perf_counter() - start
+
+    everything = [sample for values in samples.values() for sample in values]
+    report["seconds"] = seconds
+    report["throughput_rps"] = len(everything) / seconds
+    report["statuses"] = {str(code): count for code, count in sorted(statuses.items())}
+    report["overall"] = percentiles(everything)
+    report["endpoints"] = {name: percentiles(values) for name, values in samples.items() if values}
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_reports(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+        report["ok"] = not regressions
+    return report
+
+
+SCENARIOS = {
+    "getdb": bench_get_db,
+    "plans": check_plans,
+    "indexes": bench_indexes,
+    "contention": bench_contention,
+    "mixed": bench_mixed,
+    "encoding": bench_encoding,
+    "commits": bench_commits,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Бенчмарки REST API")
+    parser.add_argument("scenario", choices = sorted(SCENARIOS))
+    parser.add_argument("--requests", type = int, default = 1000)
+    parser.add_argument("--users", type = int, default = 10000)
+    parser.add_argument("--competitions", type = int, default = 100)
+    parser.add_argument("--results", type = int, default = 1000000)
+    parser.add_argument("--writers", type = int, default = 20)
+    parser.add_argument("--readers", type = int, default = 20)
+    parser.add_argument("--concurrency", type = int, default = 32)
+    parser.add_argument("--rounds", type = int, default = 10)
+    parser.add_argument("--mix", default = DEFAULT_MIX, help = "доли запросов: название=вес,...")
+    parser.add_argument("--seed", type = int, default = 1)
+    parser.add_argument("--output", help = "куда сохранить отчёт (JSON)")
+    parser.add_argument("--baseline", help = "прошлый отчёт mixed для сравнения")
+    parser.add_argument("--tolerance", type = float, default = 0.2, help = "допустимый рост p95 относительно --baseline")
+    args = parser.parse_args()
+
+    report = asyncio.run(SCENARIOS[args.scenario](args))
+    print(json.dumps(report, indent = 2, ensure_ascii = False))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 2, ensure_ascii = False)
+    if report.get("ok") is False:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
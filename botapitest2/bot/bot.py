@@ -2,75 +2,174 @@ from aiogram import Bot, Dispatcher, types
 from aiogram.types import Message, ContentType, InputMediaVideo, FSInputFile
 from aiogram.filters import Command
 import asyncio
-import requests
-import base64
+import aiohttp
+from collections import OrderedDict
+
+from scheduler import VideoScheduler, QueueFull, UserLimit
 
 tok = '6730580975:AAFDsqIx48p1ZHLVWI3PZkS2Gmvzc-00AA8'
-video_file_path = 'meow.mp4' 
 server_url = 'http://127.0.0.1:8000/'
+file_url_template = 'https://api.telegram.org/file/bot{tok}/{path}'
+
+# Размер части при пересылке видео и лимит одновременных соединений
+CHUNK_SIZE = 64 * 1024
+HTTP_CONNECTIONS = 100
+
+# Сколько видео обрабатывается одновременно, сколько может быть
+# в работе от одного чата и сколько всего может ждать в очереди
+VIDEO_WORKERS = 8
+PER_USER_LIMIT = 2
+MAX_QUEUE = 200
+
+# Ключи готовых результатов на сервере по file_unique_id видео: если то же
+# видео прислали снова, результат берётся из кэша сервера без скачивания
+RESULT_KEYS_LIMIT = 10000
+result_keys = OrderedDict()
+
+# Пулы соединений бота, создаются в start(). Для Telegram отдельный пул:
+# загрузка на сервер держит соединение, пока идёт скачивание из Telegram,
+# и с общим пулом загрузки могли бы занять все соединения
+http: aiohttp.ClientSession = None
+telegram_http: aiohttp.ClientSession = None
+scheduler: VideoScheduler = None
+
+
+class DownloadError(Exception):
+    pass
+
 
 async def get_message(message: types.Message, bot: Bot):
     if message.content_type == types.ContentType.VIDEO:
-        await handle_video(message, bot)
+        await enqueue_video(message, bot)
     else:
         await get_other(message)
 
-async def send_video_to_server(video_file_path, server_url, message: types.Message,  bot:Bot):
+# Постановка видео в очередь с ответом о месте в ней
+async def enqueue_video(message: types.Message, bot: Bot):
     try:
-        response = requests.post(server_url, files={'video': open(video_file_path, 'rb')})
-            
-        if response.status_code == 200:
-            json_response = response.json()
-            video_data = json_response.get("video")
-            image_data = json_response.get("image")
-
-            video_binary_data = base64.b64decode(video_data)
-            image_binary_data = base64.b64decode(image_data)
-
-            with open("clientvideo.mp4", "wb") as video_file:
-                video_file.write(video_binary_data)
-
-            with open("clientimage.jpg", "wb") as image_file:
-                image_file.write(image_binary_data)
-            
-            await message.reply_video(video=types.FSInputFile(path="clientvideo.mp4"))
-            await message.reply_photo(photo=types.FSInputFile(path="clientimage.jpg"))
+        position = scheduler.submit(message.chat.id, lambda: handle_video(message, bot))
+    except UserLimit:
+        await message.reply(f"У вас уже {scheduler.per_user_limit} видео в обработке, дождитесь результата.")
+        return
+    except QueueFull:
+        await message.reply("Сейчас слишком много видео, попробуйте позже.")
+        return
+
+    if position:
+        await message.reply(f"Ваше видео #{position} в очереди.")
+    else:
+        await message.reply("Видео принято, обрабатываю...")
+
+# Ответы юзеру на отказы сервера распознавания
+SERVER_ERRORS = {
+    413: "Видео слишком большое или длинное, отправьте видео покороче.",
+    422: "Не получилось прочитать видео, попробуйте другой файл.",
+    503: "Сервер сейчас перегружен, попробуйте через пару минут.",
+    507: "Сервер сейчас перегружен, попробуйте через пару минут.",
+}
+
+async def send_video_to_server(file_url, server_url, message: types.Message,  bot:Bot):
+    # Ответ Telegram проверяется до запроса к серверу: ошибку, брошенную уже во время
+    # загрузки, aiohttp обернул бы в ошибку соединения с сервером
+    async with telegram_http.get(file_url) as download:
+        if download.status != 200:
+            raise DownloadError(download.status)
+
+        # Видео из Telegram по частям сразу уходит на сервер, на диск ничего не пишется
+        form = aiohttp.FormData()
+        form.add_field('video', download.content.iter_chunked(CHUNK_SIZE), filename='video.mp4', content_type='video/mp4')
+
+        async with http.post(f"{server_url}jobs", data=form) as response:
+            if response.status != 200:
+                print(f"Произошла ошибка: {response.status}")
+                await message.reply(SERVER_ERRORS.get(response.status, "Не удалось обработать видео, попробуйте позже."))
+                return
+            job = await response.json()
+
+    job_url = f"{server_url}jobs/{job['job_id']}"
+    while job["status"] in ("queued", "running"):
+        async with http.get(f"{job_url}/wait", params={"timeout": 30}) as response:
+            job = await response.json()
+
+    if job["status"] != "done":
+        print(f"Произошла ошибка: {job['error'] or job['status']}")
+        if job["status"] == "timeout":
+            await message.reply("Видео обрабатывалось слишком долго. Попробуйте видео покороче.")
         else:
-            print(f"Произошла ошибка: {response.status_code}")
-    except Exception as e:
-        print(f"Произошла ошибка: {e}")
+            await message.reply("Не удалось обработать видео, попробуйте позже.")
+        return
+
+    remember_result(message.video.file_unique_id, job["key"])
+    await reply_with_result(job, server_url, message, bot)
+
+def remember_result(file_unique_id, key):
+    result_keys[file_unique_id] = key
+    result_keys.move_to_end(file_unique_id)
+    while len(result_keys) > RESULT_KEYS_LIMIT:
+        result_keys.popitem(last=False)
+
+# Готовый результат из кэша сервера или None
+async def cached_result(file_unique_id, server_url):
+    key = result_keys.get(file_unique_id)
+    if key is None:
+        return None
+    async with http.get(f"{server_url}cache/{key}") as response:
+        if response.status == 200:
+            return await response.json()
+    del result_keys[file_unique_id]
+    return None
+
+async def reply_with_result(job, server_url, message: types.Message, bot: Bot):
+    job_url = f"{server_url}jobs/{job['job_id']}"
+    # Файлы результата скачивает aiogram в процессе бота (сервер слушает только
+    # 127.0.0.1 и из Telegram недоступен) и по частям пересылает в Telegram
+    await message.reply_video(video=types.URLInputFile(f"{job_url}/video", filename="video.mp4", bot=bot))
+    if job["result"]["found"]:
+        await message.reply_photo(photo=types.URLInputFile(f"{job_url}/photo", filename="photo.jpg", bot=bot))
 
 async def get_other(message: types.Message):
     await message.reply("Пожалуйста, отправьте только видео.")
 
 async def handle_video(message: types.Message, bot:Bot):
     video = message.video
-    file_id = video.file_id
-    file_info = await bot.get_file(file_id)
-    file_path = file_info.file_path
-    file_url = f"https://api.telegram.org/file/bot{tok}/{file_path}"
     try:
-        with requests.get(file_url) as response:
-            if response.status_code == 200:
-                with open('meow.mp4', 'wb') as f:
-                    f.write(response.content)
-                await send_video_to_server(video_file_path, server_url, message,  bot)
-            else:
-                await message.reply("Произошла ошибка при скачивании видео.")
+        job = await cached_result(video.file_unique_id, server_url)
+        if job is not None:
+            await reply_with_result(job, server_url, message, bot)
+            return
+        file_id = video.file_id
+        file_info = await bot.get_file(file_id)
+        file_path = file_info.file_path
+        file_url = file_url_template.format(tok=tok, path=file_path)
+        await send_video_to_server(file_url, server_url, message,  bot)
+    except DownloadError:
+        await message.reply("Произошла ошибка при скачивании видео.")
+    except aiohttp.ClientError as e:
+        # Обрыв соединения с Telegram или с сервером посреди загрузки
+        print(f"Произошла ошибка: {e}")
+        await message.reply("Не удалось обработать видео, попробуйте позже.")
     except Exception as e:
         await message.reply(f"Произошла ошибка: {e}")
     
     
 
 async def start():
+    global http, telegram_http, scheduler
     bot = Bot(token=tok)
     dp=Dispatcher()
+    http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=HTTP_CONNECTIONS))
+    telegram_http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=HTTP_CONNECTIONS))
+    scheduler = VideoScheduler(VIDEO_WORKERS, PER_USER_LIMIT, MAX_QUEUE)
+    scheduler.start()
 
     dp.message.register(get_message)
 
     try:
         await dp.start_polling(bot)
     finally:
+        await scheduler.stop()
+        await http.close()
+        await telegram_http.close()
         await bot.session.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,153 @@
+# Нагрузочный тест бота: много пользователей одновременно присылают видео.
+# Telegram и сервер распознавания заменены локальными заглушками на aiohttp.
+# Запуск: python loadtest.py --users 200 --size 5000000
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from types import SimpleNamespace
+
+from aiohttp import web
+
+import bot
+
+
+# Заглушка Telegram: отдаёт видео нужного размера по частям
+def telegram_app(size):
+    async def file(request):
+        response = web.StreamResponse()
+        response.content_length = size
+        await response.prepare(request)
+        chunk = b"\0" * bot.CHUNK_SIZE
+        for start in range(0, size, len(chunk)):
+            await response.write(chunk[:size - start])
+        return response
+
+    app = web.Application()
+    app.router.add_get("/file/{tail:.*}", file)
+    return app
+
+
+# Заглушка сервера распознавания: принимает видео и "обрабатывает" его delay секунд
+def server_app(delay):
+    received = {}
+
+    async def create_job(request):
+        reader = await request.multipart()
+        part = await reader.next()
+        size = 0
+        while chunk := await part.read_chunk():
+            size += len(chunk)
+        job_id = uuid.uuid4().hex
+        received[job_id] = size
+        return web.json_response({"job_id": job_id, "status": "queued", "result": None, "error": None})
+
+    async def wait(request):
+        await asyncio.sleep(delay)
+        return web.json_response({"job_id": request.match_info["job_id"], "status": "done",
+                                  "result": {"found": True}, "error": None, "key": request.match_info["job_id"]})
+
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_post("/jobs", create_job)
+    app.router.add_get("/jobs/{job_id}/wait", wait)
+    app["received"] = received
+    return app
+
+
+class FakeMessage:
+    def __init__(self, user_id):
+        self.chat = SimpleNamespace(id=user_id)
+        self.video = SimpleNamespace(file_id=f"file-{user_id}", file_unique_id=f"unique-{user_id}")
+        self.content_type = bot.types.ContentType.VIDEO
+        self.replies = []
+        self.sent = time.perf_counter()
+        self.answered = None
+
+    async def reply(self, text):
+        self.replies.append(text)
+
+    async def reply_video(self, video):
+        self.replies.append("video")
+
+    async def reply_photo(self, photo):
+        self.replies.append("photo")
+        self.answered = time.perf_counter()
+
+
+class FakeBot:
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path=f"videos/{file_id}.mp4")
+
+
+async def start_site(app, port):
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+# Наибольшая задержка event loop за время теста: показывает, блокируется ли он
+async def loop_lag(stop, interval=0.01):
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run(args):
+    server = server_app(args.delay)
+    runners = [await start_site(telegram_app(args.size), args.port), await start_site(server, args.port + 1)]
+    bot.file_url_template = f"http://127.0.0.1:{args.port}/file/bot{{tok}}/{{path}}"
+    bot.server_url = f"http://127.0.0.1:{args.port + 1}/"
+    bot.http = bot.aiohttp.ClientSession(connector=bot.aiohttp.TCPConnector(limit=bot.HTTP_CONNECTIONS))
+    bot.telegram_http = bot.aiohttp.ClientSession(connector=bot.aiohttp.TCPConnector(limit=bot.HTTP_CONNECTIONS))
+    bot.scheduler = bot.VideoScheduler(args.workers, bot.PER_USER_LIMIT, args.users)
+    bot.scheduler.start()
+
+    stop = asyncio.Event()
+    lag = asyncio.create_task(loop_lag(stop))
+    fake_bot = FakeBot()
+    messages = [FakeMessage(user_id) for user_id in range(args.users)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*[bot.get_message(message, fake_bot) for message in messages])
+    await bot.scheduler.join()
+    seconds = time.perf_counter() - start
+    stop.set()
+
+    await bot.scheduler.stop()
+    await bot.http.close()
+    await bot.telegram_http.close()
+    for runner in runners:
+        await runner.cleanup()
+
+    latencies = sorted(message.answered - message.sent for message in messages if message.answered)
+    return {
+        "users": args.users,
+        "video_bytes": args.size,
+        "seconds": seconds,
+        "p50_s": latencies[len(latencies) // 2],
+        "p99_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "max_loop_lag_ms": await lag * 1000,
+        "complete_uploads": sum(size == args.size for size in server["received"].values()),
+        "answered": sum(message.replies[-2:] == ["video", "photo"] for message in messages),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--size", type=int, default=5 * 1024 * 1024)
+    parser.add_argument("--delay", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=bot.VIDEO_WORKERS)
+    parser.add_argument("--port", type=int, default=18080)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
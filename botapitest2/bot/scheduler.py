@@ -0,0 +1,101 @@
+import asyncio
+from collections import deque
+
+
+class QueueFull(Exception):
+    pass
+
+
+class UserLimit(Exception):
+    pass
+
+
+# Планировщик обработки видео: не больше workers видео обрабатывается
+# одновременно, от одного чата в работе и очереди не больше per_user_limit,
+# всего в очереди не больше max_queue. Очередь обходится по кругу между
+# чатами, чтобы один чат с кучей видео не задерживал остальных
+class VideoScheduler:
+    def __init__(self, workers, per_user_limit, max_queue):
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self.max_queue = max_queue
+        self.running = 0
+        self._queues = {}
+        self._order = deque()
+        self._in_flight = {}
+        self._items = asyncio.Semaphore(0)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    # Ожидание, пока не будут обработаны все видео
+    async def join(self):
+        await self._idle.wait()
+
+    @property
+    def queued(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    # Постановка в очередь: func - функция без аргументов, возвращающая корутину.
+    # Возвращает место в очереди (0 - видео сразу берётся в работу)
+    def submit(self, chat_id, func):
+        if self._in_flight.get(chat_id, 0) >= self.per_user_limit:
+            raise UserLimit()
+        if self.queued >= self.max_queue:
+            raise QueueFull()
+
+        if chat_id not in self._queues:
+            self._queues[chat_id] = deque()
+            self._order.append(chat_id)
+        self._queues[chat_id].append(func)
+        self._in_flight[chat_id] = self._in_flight.get(chat_id, 0) + 1
+        self._idle.clear()
+        position = self._position(chat_id, len(self._queues[chat_id]) - 1)
+        self._items.release()
+        return max(0, position - (self.workers - self.running))
+
+    # Сколько видео будет взято в работу раньше i-го видео чата chat_id, плюс оно само
+    def _position(self, chat_id, i):
+        position = i + 1
+        ahead = True
+        for other in self._order:
+            if other == chat_id:
+                ahead = False
+                continue
+            position += min(len(self._queues[other]), i + 1 if ahead else i)
+        return position
+
+    def _next(self):
+        chat_id = self._order.popleft()
+        queue = self._queues[chat_id]
+        func = queue.popleft()
+        if queue:
+            self._order.append(chat_id)
+        else:
+            del self._queues[chat_id]
+        return chat_id, func
+
+    async def _worker(self):
+        while True:
+            await self._items.acquire()
+            chat_id, func = self._next()
+            self.running += 1
+            try:
+                await func()
+            except Exception as e:
+                print(f"Произошла ошибка: {e}")
+            finally:
+                self.running -= 1
+                self._in_flight[chat_id] -= 1
+                if not self._in_flight[chat_id]:
+                    del self._in_flight[chat_id]
+                if not self._in_flight:
+                    self._idle.set()
@@ -0,0 +1,182 @@
+# Микробенчмарки распознавания. Запуск: python bench.py <сценарий> [параметры]
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from mediapipe.framework.formats import landmark_pb2
+
+from gestures import classify, is_gesture, landmarks_array, pixel_points
+
+
+# Случайные точки руки в формате MediaPipe
+def fake_hands(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        landmark_pb2.NormalizedLandmarkList(
+            landmark=[landmark_pb2.NormalizedLandmark(x=x, y=y, z=0.0) for x, y in rng.random((21, 2))])
+        for _ in range(n)
+    ]
+
+
+# Прежний цикл: на каждую из 21 точки заново считаются координаты и жест
+def legacy_loop(image, hand_landmarks, w, h):
+    colorgreen = [0, 200, 0]
+    colorred = [0, 0, 255]
+    radius = 10
+    found = False
+    for lm in hand_landmarks.landmark:
+        coordinates = (int(lm.x * w), int(lm.y * h))
+        cv2.circle(image, coordinates, radius, colorred)
+        index_coord6y = int(hand_landmarks.landmark[6].y * h)
+        index_coord8y = int(hand_landmarks.landmark[8].y * h)
+        middle_coord12y = int(hand_landmarks.landmark[12].y * h)
+        pinky_coord20y = int(hand_landmarks.landmark[20].y * h)
+        ring_coord16y = int(hand_landmarks.landmark[16].y * h)
+        index_open = not index_coord6y < index_coord8y
+        middle_open = not index_coord6y < middle_coord12y
+        ring_open = not index_coord6y < ring_coord16y
+        pinky_open = not index_coord6y < pinky_coord20y
+        if index_open and middle_open and not ring_open and not pinky_open:
+            cv2.circle(image, coordinates, radius, colorgreen, thickness=1)
+            found = True
+    return found
+
+
+def vectorized(image, hand_landmarks, w, h):
+    circle = cv2.circle
+    points = landmarks_array(hand_landmarks)
+    found = is_gesture(points, h, "peace")
+    color = [0, 200, 0] if found else [0, 0, 255]
+    for coordinates in pixel_points(points, w, h).tolist():
+        circle(image, coordinates, 10, color, thickness=1)
+    return found
+
+
+# Классификация кадра: прежний цикл против векторизованного, и пачкой без рисования
+def bench_gestures(args):
+    hands = fake_hands(args.frames)
+    image = np.zeros((720, 1280, 3), np.uint8)
+    h, w, _ = image.shape
+    report = {}
+
+    for name, func in [("legacy", legacy_loop), ("vectorized", vectorized)]:
+        start = time.perf_counter()
+        verdicts = [func(image, hand, w, h) for hand in hands]
+        seconds = time.perf_counter() - start
+        report[name] = {"us_per_frame": seconds / len(hands) * 1e6, "found": sum(verdicts)}
+
+    points = np.stack([landmarks_array(hand) for hand in hands])
+    start = time.perf_counter()
+    verdicts = classify(points, h, ["peace"])
+    seconds = time.perf_counter() - start
+    report["batched_classify"] = {"us_per_frame": seconds / len(hands) * 1e6,
+                                  "found": sum(v is not None for v in verdicts)}
+    return report
+
+
+# Короткий клип: frames кадров размером width x height, залитых цветом color (BGR)
+def make_clip(path, frames, width, height, color):
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 20.0, (width, height))
+    frame = np.full((height, width, 3), color, np.uint8)
+    for _ in range(frames):
+        out.write(frame)
+    out.release()
+
+
+def video_info(path):
+    video = cv2.VideoCapture(path)
+    try:
+        ret, frame = video.read()
+        return {
+            "frames": int(video.get(cv2.CAP_PROP_FRAME_COUNT)),
+            "size": (int(video.get(cv2.CAP_PROP_FRAME_WIDTH)), int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))),
+            "color": frame.reshape(-1, 3).mean(axis=0).tolist() if ret else None,
+        }
+    finally:
+        video.release()
+
+
+# Стресс-тест изоляции задач: --jobs разных клипов отправляются на /jobs одновременно,
+# затем у каждой задачи сверяются хэш сохранённого входного видео и размеченное
+# видео (число кадров, размер и цвет) с её собственным клипом. Код выхода 1,
+# если результаты хотя бы одной задачи перепутались
+def bench_isolation(args):
+    root = tempfile.mkdtemp()
+    os.environ.setdefault("REC_WORK_DIR", os.path.join(root, "jobs"))
+    os.environ.setdefault("REC_CACHE_DIR", os.path.join(root, "cache"))
+    os.environ.setdefault("REC_MAX_PENDING", str(args.jobs))
+    import httpx
+    import server
+
+    clips = []
+    for i in range(args.jobs):
+        path = os.path.join(root, f"clip{i}.mp4")
+        color = ((i * 37) % 256, (i * 91) % 256, (i * 53 + 40) % 256)
+        make_clip(path, 5 + i % 17, 160 + 16 * (i % 8), 120 + 16 * (i % 5), color)
+        with open(path, "rb") as f:
+            data = f.read()
+        clips.append({"path": path, "data": data, "sha256": hashlib.sha256(data).hexdigest(), **video_info(path)})
+
+    async def run():
+        async with server.app.router.lifespan_context(server.app):
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                async def one(clip):
+                    response = await client.post("/jobs", files={"video": ("video.mp4", clip["data"], "video/mp4")})
+                    response.raise_for_status()
+                    job = response.json()
+                    while job["status"] in ("queued", "running"):
+                        job = (await client.get(f"/jobs/{job['job_id']}/wait", params={"timeout": 30})).json()
+                    errors = []
+                    if job["status"] != "done":
+                        return [f"статус {job['status']}: {job['error']}"]
+                    workdir = server.queue.get(job["job_id"]).workdir
+                    with open(os.path.join(workdir, server.file), "rb") as f:
+                        if hashlib.sha256(f.read()).hexdigest() != clip["sha256"]:
+                            errors.append("входное видео задачи не совпадает с отправленным")
+                    output = video_info(os.path.join(workdir, server.out_vid_path))
+                    if job["result"]["frames"] != clip["frames"] or output["frames"] != clip["frames"]:
+                        errors.append(f"кадров {job['result']['frames']}/{output['frames']}, ожидалось {clip['frames']}")
+                    if output["size"][1] != clip["size"][1] - clip["size"][1] % 2:
+                        errors.append(f"размер {output['size']}, ожидалось {clip['size']}")
+                    if max(abs(a - b) for a, b in zip(output["color"], clip["color"])) > 8:
+                        errors.append(f"цвет {output['color']}, ожидалось {clip['color']}")
+                    return errors
+
+                start = time.perf_counter()
+                results = await asyncio.gather(*[one(clip) for clip in clips])
+                return time.perf_counter() - start, results
+
+    seconds, results = asyncio.run(run())
+    failed = {i: errors for i, errors in enumerate(results) if errors}
+    return {"jobs": args.jobs, "workers": server.WORKERS, "seconds": seconds, "failed": failed, "ok": not failed}
+
+
+SCENARIOS = {
+    "gestures": bench_gestures,
+    "isolation": bench_isolation,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки распознавания")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--frames", type=int, default=10000)
+    parser.add_argument("--jobs", type=int, default=32)
+    args = parser.parse_args()
+
+    report = SCENARIOS[args.scenario](args)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report.get("ok") is False:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
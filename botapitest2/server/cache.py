@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import shutil
+from collections import OrderedDict
+
+
+# Кэш результатов распознавания на диске. Ключ - хэш содержимого видео
+# и параметров анализа, в папке записи лежат файлы результата и meta.json.
+# Когда суммарный размер больше max_bytes, удаляются давно не использованные записи
+class ResultCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def key(content_hash, params):
+        return hashlib.sha256(f"{content_hash}:{json.dumps(params, sort_keys=True)}".encode()).hexdigest()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return sum(self._entries.values())
+
+    # Загрузка записей с диска, порядок LRU - по времени последнего обращения
+    def load(self):
+        os.makedirs(self.root, exist_ok=True)
+        entries = []
+        for key in os.listdir(self.root):
+            meta = os.path.join(self.root, key, "meta.json")
+            if os.path.exists(meta):
+                entries.append((os.path.getmtime(meta), key, self._dir_size(os.path.join(self.root, key))))
+            else:
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(entries))
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    # Запись кэша: {"dir": папка с файлами, "result": результат распознавания} или None
+    def get(self, key):
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        meta = os.path.join(self.path(key), "meta.json")
+        try:
+            with open(meta) as f:
+                result = json.load(f)
+            os.utime(meta)
+        except OSError:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return {"dir": self.path(key), "result": result}
+
+    # Сохранение файлов names из папки workdir. Файлы связываются жёсткими
+    # ссылками (рабочие папки и кэш на одном диске), иначе копируются
+    def put(self, key, workdir, names, result):
+        if key in self._entries:
+            return
+        target = self.path(key)
+        os.makedirs(target, exist_ok=True)
+        for name in names:
+            source = os.path.join(workdir, name)
+            if not os.path.exists(source):
+                continue
+            try:
+                os.link(source, os.path.join(target, name))
+            except OSError:
+                shutil.copyfile(source, os.path.join(target, name))
+        with open(os.path.join(target, "meta.json"), "w") as f:
+            json.dump(result, f)
+        self._entries[key] = self._dir_size(target)
+        self._evict()
+
+    def _evict(self):
+        while self._entries and self.size > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            shutil.rmtree(self.path(key), ignore_errors=True)
+
+    @staticmethod
+    def _dir_size(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
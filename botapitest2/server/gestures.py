@@ -0,0 +1,69 @@
+import numpy as np
+
+# Пальцы в порядке столбцов массива состояний и номера их кончиков
+FINGERS = ("index", "middle", "ring", "pinky")
+TIP_IDS = np.array([8, 12, 16, 20])
+# Сустав указательного пальца: палец считается разогнутым,
+# если его кончик не ниже этой точки
+REFERENCE_ID = 6
+
+# Жесты: состояние каждого пальца (True - разогнут, False - согнут, None - любое)
+GESTURES = {
+    "peace": (True, True, False, False),
+    "point": (True, False, False, False),
+    "palm": (True, True, True, True),
+    "fist": (False, False, False, False),
+}
+
+
+# Жесты в виде массивов (состояния пальцев, маска пальцев, которые проверяются)
+_compiled = {}
+
+
+def register_gesture(name, pattern):
+    if len(pattern) != len(FINGERS):
+        raise ValueError(f"Нужно состояние для каждого пальца: {FINGERS}")
+    GESTURES[name] = tuple(pattern)
+    _compiled.clear()
+
+
+# Точки руки MediaPipe в массив (21, 3) с относительными координатами
+def landmarks_array(hand_landmarks):
+    return np.array([(lm.x, lm.y, lm.z) for lm in hand_landmarks.landmark])
+
+
+# Разогнутые пальцы для одного кадра (21, 3) или пачки кадров (N, 21, 3).
+# Сравнение идёт в пикселях кадра высотой h, как и раньше
+def finger_states(points, h):
+    y = (points[..., 1] * h).astype(np.int32)
+    return y[..., [REFERENCE_ID]] >= y[..., TIP_IDS]
+
+
+def _patterns(names, gestures):
+    key = tuple((name, gestures[name]) for name in names)
+    if key not in _compiled:
+        patterns = np.array([[False if s is None else s for s in gestures[name]] for name in names], dtype=bool)
+        care = np.array([[s is not None for s in gestures[name]] for name in names], dtype=bool)
+        _compiled[key] = patterns, ~care
+    return _compiled[key]
+
+
+# Жесты для пачки кадров (N, 21, 3): список с названием первого подходящего жеста или None
+def classify(points, h, names=None, gestures=GESTURES):
+    names = list(gestures) if names is None else list(names)
+    patterns, ignored = _patterns(names, gestures)
+    states = finger_states(np.asarray(points).reshape(-1, 21, 3), h)
+    matches = ((states[:, None, :] == patterns[None]) | ignored[None]).all(axis=-1)
+    first = matches.argmax(axis=1)
+    return [names[i] if hit else None for i, hit in zip(first, matches.any(axis=1))]
+
+
+# Совпадает ли кадр (21, 3) с жестом name
+def is_gesture(points, h, name, gestures=GESTURES):
+    patterns, ignored = _patterns((name,), gestures)
+    return bool(((finger_states(points, h) == patterns[0]) | ignored[0]).all())
+
+
+# Точки в пикселях кадра для рисования
+def pixel_points(points, w, h):
+    return (points[:, :2] * (w, h)).astype(np.int32)
@@ -0,0 +1,117 @@
+import hashlib
+
+import cv2
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# Запас на заголовки и разделители multipart сверх размера самого видео
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class BadUpload(Exception):
+    pass
+
+
+# Загруженное видео: путь, размер и sha256 содержимого
+class Upload:
+    def __init__(self, path, size, sha256):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+
+# Запись тела запроса в файл по мере получения, без буфера в памяти и без
+# промежуточного временного файла. Принимается multipart/form-data с файлом
+# в поле field (как от бота) или видео прямо в теле запроса. Больше max_bytes
+# не пишется: если размер известен из Content-Length, запрос отклоняется сразу,
+# иначе - как только тело превысит лимит. Хэш считается во время записи.
+# reserve вызывается с числом записанных байт перед каждой записью (проверка
+# места на диске, её исключение прерывает приём)
+async def receive_video(request, path, max_bytes, field="video", reserve=None):
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD:
+        raise UploadTooLarge()
+
+    digest = hashlib.sha256()
+    size = 0
+    found = False
+
+    with open(path, "wb") as out:
+        def write(data):
+            nonlocal size
+            size += len(data)
+            if size > max_bytes:
+                raise UploadTooLarge()
+            if reserve is not None:
+                reserve(size)
+            digest.update(data)
+            out.write(data)
+
+        content_type, params = parse_options_header(request.headers.get("content-type"))
+        if content_type == b"multipart/form-data":
+            if b"boundary" not in params:
+                raise BadUpload("Нет boundary в Content-Type")
+            part = {"header": b"", "value": b"", "name": None, "video": False}
+
+            def on_part_begin():
+                part.update(header=b"", value=b"", name=None)
+
+            def on_header_field(data, start, end):
+                part["header"] += data[start:end]
+
+            def on_header_value(data, start, end):
+                part["value"] += data[start:end]
+
+            def on_header_end():
+                if part["header"].lower() == b"content-disposition":
+                    part["name"] = parse_options_header(part["value"])[1].get(b"name")
+                part.update(header=b"", value=b"")
+
+            def on_headers_finished():
+                nonlocal found
+                part["video"] = part["name"] == field.encode() and not found
+                found = found or part["video"]
+
+            def on_part_data(data, start, end):
+                if part["video"]:
+                    write(data[start:end])
+
+            parser = MultipartParser(params[b"boundary"], {
+                "on_part_begin": on_part_begin,
+                "on_header_field": on_header_field,
+                "on_header_value": on_header_value,
+                "on_header_end": on_header_end,
+                "on_headers_finished": on_headers_finished,
+                "on_part_data": on_part_data,
+            })
+            async for chunk in request.stream():
+                parser.write(chunk)
+            parser.finalize()
+        else:
+            async for chunk in request.stream():
+                write(chunk)
+            found = size > 0
+
+    if not found:
+        raise BadUpload(f"Нет видео в поле {field}")
+    return Upload(path, size, digest.hexdigest())
+
+
+# Длительность видео в секундах по заголовку контейнера (число кадров и fps),
+# кадры не декодируются. None - если контейнер их не сообщает.
+# BadUpload - если файл не открывается как видео
+def probe_duration(path):
+    video = cv2.VideoCapture(path)
+    try:
+        if not video.isOpened():
+            raise BadUpload("Файл не является видео")
+        frames = video.get(cv2.CAP_PROP_FRAME_COUNT)
+        fps = video.get(cv2.CAP_PROP_FPS)
+    finally:
+        video.release()
+    if frames > 0 and 0 < fps <= 1000:
+        return frames / fps
+    return None
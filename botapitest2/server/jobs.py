@@ -0,0 +1,210 @@
+import asyncio
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, timeout, workdir=None, key=None):
+        self.id = uuid.uuid4().hex
+        self.workdir = workdir
+        # Ключ результата в кэше и признак, что результат взят из кэша
+        self.key = key
+        self.cached = False
+        # queued -> running -> done / failed / timeout / cancelled
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.timeout = timeout
+        self.created = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.done = asyncio.Event()
+        self.task = None
+        # Флаг остановки для процесса пула (multiprocessing.Event), создаётся при запуске
+        self.stop_event = None
+
+    def info(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "key": self.key,
+            "cached": self.cached,
+        }
+
+
+# Очередь задач распознавания: задачи выполняются в пуле процессов,
+# чтобы не блокировать event loop. Одновременно выполняется не больше
+# workers задач, в очереди (вместе с выполняемыми) не больше max_pending.
+# Процесс пула нельзя прервать снаружи, поэтому func получает аргумент stop
+# (multiprocessing.Event) и должна проверять его и завершаться, когда он
+# установлен: при отмене, таймауте и остановке очереди
+class JobQueue:
+    def __init__(self, workers, max_pending, timeout, keep_seconds=600, on_forget=None, on_finish=None,
+                 initializer=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.keep_seconds = keep_seconds
+        # Вызывается с задачей, когда она удаляется из очереди
+        self.on_forget = on_forget
+        # Вызывается с задачей, когда она завершилась (успешно или нет)
+        self.on_finish = on_finish
+        # Выполняется в каждом процессе пула при его запуске
+        self.initializer = initializer
+        self.jobs = {}
+        self._executor = None
+        self._manager = None
+        self._slots = None
+
+    def start(self):
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+        # События остановки передаются в процессы пула через менеджер
+        self._manager = multiprocessing.Manager()
+        self._slots = asyncio.Semaphore(self.workers)
+
+    # Запуск func workers раз, чтобы процессы пула стартовали и выполнили initializer до приёма задач
+    async def warm_up(self, func):
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*[loop.run_in_executor(self._executor, func) for _ in range(self.workers)])
+
+    # Остановка: выполняемые задачи получают флаг остановки, процессы пула
+    # дожидаются их завершения и закрываются
+    async def stop(self):
+        for job in list(self.jobs.values()):
+            self.cancel(job.id)
+        await asyncio.to_thread(self._executor.shutdown, wait=True, cancel_futures=True)
+        self._manager.shutdown()
+        for job_id in list(self.jobs):
+            self.forget(job_id)
+
+    @property
+    def pending(self):
+        return sum(1 for job in self.jobs.values() if not job.done.is_set())
+
+    def has_room(self):
+        self._forget_old()
+        return self.pending < self.max_pending
+
+    # after - корутина-функция, которая получает результат из пула и возвращает
+    # итоговый (дообработка вне пула, например перекодирование видео). Она
+    # выполняется после освобождения места в пуле, но в пределах таймаута задачи
+    def submit(self, func, *args, timeout=None, workdir=None, key=None, after=None):
+        if not self.has_room():
+            raise QueueFull()
+        job = Job(timeout or self.timeout, workdir, key)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, func, args, after))
+        return job
+
+    # Уже готовая задача (результат из кэша), в пул не отправляется
+    def completed(self, result, workdir=None, key=None):
+        self._forget_old()
+        job = Job(self.timeout, workdir, key)
+        job.cached = True
+        job.result = result
+        job.status = "done"
+        job.finished = time.monotonic()
+        job.done.set()
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def wait(self, job, timeout=None):
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None or job.done.is_set():
+            return False
+        job.task.cancel()
+        self._interrupt(job)
+        # Задача могла ещё не начаться, тогда её код уже не выполнится
+        if job.status == "queued":
+            self._finish(job, "cancelled")
+        return True
+
+    async def _run(self, job, func, args, after=None):
+        loop = asyncio.get_running_loop()
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            self._finish(job, "cancelled")
+            return
+
+        job.status = "running"
+        job.started = time.monotonic()
+        job.stop_event = self._manager.Event()
+        future = self._executor.submit(func, *args, stop=job.stop_event)
+        # Слот освобождается только когда процесс действительно закончил,
+        # даже если задачу уже отменили или она превысила таймаут
+        future.add_done_callback(lambda _: self._release(loop))
+
+        async def run():
+            result = await asyncio.wrap_future(future)
+            return result if after is None else await after(result)
+
+        try:
+            result = await asyncio.wait_for(run(), job.timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            self._interrupt(job)
+            self._finish(job, "timeout", error=f"Превышено время обработки ({job.timeout} с)")
+        except asyncio.CancelledError:
+            future.cancel()
+            self._interrupt(job)
+            self._finish(job, "cancelled")
+        except Exception as e:
+            self._finish(job, "failed", error=str(e))
+        else:
+            job.result = result
+            self._finish(job, "done")
+
+    # Просьба к процессу пула прекратить выполнение задачи
+    def _interrupt(self, job):
+        if job.stop_event is not None:
+            try:
+                job.stop_event.set()
+            except (OSError, EOFError):
+                # Менеджер уже остановлен
+                pass
+
+    def _release(self, loop):
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._slots.release)
+
+    def _finish(self, job, status, error=None):
+        if job.done.is_set():
+            return
+        job.status = status
+        job.error = error
+        job.finished = time.monotonic()
+        job.done.set()
+        if self.on_finish is not None:
+            self.on_finish(job)
+
+    def forget(self, job_id):
+        self.cancel(job_id)
+        job = self.jobs.pop(job_id, None)
+        if job is not None and self.on_forget is not None:
+            self.on_forget(job)
+
+    # Завершённые задачи хранятся keep_seconds, потом удаляются
+    def _forget_old(self):
+        now = time.monotonic()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished is not None and now - job.finished > self.keep_seconds:
+                self.forget(job_id)
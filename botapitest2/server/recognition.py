@@ -0,0 +1,157 @@
+import os
+import time
+
+import cv2
+import mediapipe as mp
+
+from gestures import is_gesture, landmarks_array, pixel_points
+
+# fps выходного видео, если исходное его не сообщает
+DEFAULT_FPS = 20.0
+
+# Режимы анализа:
+# full - размечается и записывается всё видео
+# detect - остановка на первом найденном жесте, видео не записывается
+MODES = ("full", "detect")
+
+
+# Обработка остановлена по флагу stop (отмена или таймаут задачи)
+class Interrupted(Exception):
+    pass
+
+# Модель Hands процесса-обработчика: создаётся один раз при старте процесса
+# и переиспользуется для всех видео, между видео сбрасывается
+_hands = None
+_hands_init_seconds = None
+
+
+def create_hands():
+    return mp.solutions.hands.Hands(static_image_mode=False,
+                                    max_num_hands=1, min_detection_confidence=0.7, min_tracking_confidence=0.7)
+
+
+# Инициализатор процесса в пуле
+def init_worker():
+    global _hands, _hands_init_seconds
+    started = time.perf_counter()
+    _hands = create_hands()
+    _hands_init_seconds = time.perf_counter() - started
+
+
+# Прогрев: гарантирует, что модель процесса загружена, и сообщает время загрузки
+def warm_up():
+    if _hands is None:
+        init_worker()
+    return {"pid": os.getpid(), "init_seconds": _hands_init_seconds}
+
+
+# Распознавание жеста (по умолчанию "peace") на видео.
+# stride - распознавать каждый N-й кадр, scale - масштаб кадра для распознавания
+# (точки рисуются на исходном кадре, так как координаты MediaPipe относительные).
+# Возвращает словарь: найден ли жест, сколько кадров прочитано и обработано, время
+# всего и по этапам (decode - чтение кадров, inference - MediaPipe, draw - разметка,
+# encode - запись видео и фото). stop - флаг (multiprocessing.Event), по которому
+# обработка прерывается между кадрами исключением Interrupted
+def hand_rec_video(file, out_vid_path, out_photo_path, mode="full", stride=1, scale=1.0, gesture="peace",
+                   stop=None):
+    started = time.perf_counter()
+    found = False
+    frames = 0
+    processed = 0
+    stages = {"decode": 0.0, "inference": 0.0, "draw": 0.0, "encode": 0.0}
+    clock = time.perf_counter
+
+    warm = _hands is not None
+    pool = warm_up()
+    hand = _hands
+    video = cv2.VideoCapture(file)
+    # fps исходника, чтобы длительность размеченного видео совпадала с исходным
+    fps = video.get(cv2.CAP_PROP_FPS)
+    if not 0 < fps <= 1000:
+        fps = DEFAULT_FPS
+    mpDraw = mp.solutions.drawing_utils
+    connections = mp.solutions.hands.HAND_CONNECTIONS
+    red_spec = mpDraw.DrawingSpec(color=(0, 0, 255))
+    green_spec = mpDraw.DrawingSpec(color=(0, 200, 0))
+    circle = cv2.circle
+
+    colorgreen = [0, 200, 0]
+    colorred = [0, 0, 255]
+    radius = 10
+
+    # Используем mp4v для кодирования в mp4
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = None
+
+    try:
+        while True:
+            if stop is not None and stop.is_set():
+                raise Interrupted()
+            tick = clock()
+            ret, image = video.read()
+            stages["decode"] += clock() - tick
+            if not ret:
+                break
+            frames += 1
+            h, w, _ = image.shape
+
+            if out is None and mode == "full":
+                # Указываем размер кадра как (ширина, высота) и fps
+                out = cv2.VideoWriter(out_vid_path, fourcc, fps, (w, h))
+
+            if (frames - 1) % stride == 0:
+                processed += 1
+                tick = clock()
+                if scale != 1.0:
+                    results = hand.process(cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA))
+                else:
+                    results = hand.process(image)
+                stages["inference"] += clock() - tick
+
+                tick = clock()
+                if results.multi_hand_landmarks:
+                    hand_landmarks = results.multi_hand_landmarks[0]
+                    points = landmarks_array(hand_landmarks)
+                    if is_gesture(points, h, gesture):
+                        mpDraw.draw_landmarks(image, hand_landmarks, connections, landmark_drawing_spec=green_spec)
+                        for coordinates in pixel_points(points, w, h).tolist():
+                            circle(image, coordinates, radius, colorgreen, thickness=1)
+                        if not found:
+                            print('Peace!')
+                            photo_tick = clock()
+                            cv2.imwrite(out_photo_path, image)
+                            stages["encode"] += clock() - photo_tick
+                            # Запись фото не входит в разметку
+                            tick += clock() - photo_tick
+                            found = True
+                    else:
+                        mpDraw.draw_landmarks(image, hand_landmarks, connections, landmark_drawing_spec=red_spec)
+                        for coordinates in pixel_points(points, w, h).tolist():
+                            circle(image, coordinates, radius, colorred)
+                stages["draw"] += clock() - tick
+
+            if out is not None:
+                tick = clock()
+                out.write(image)  # Записываем кадр с отрисованными точками
+                stages["encode"] += clock() - tick
+
+            if found and mode == "detect":
+                break
+    finally:
+        if out is not None:
+            out.release()
+        video.release()
+        # Сброс состояния трекинга перед следующим видео
+        hand.reset()
+
+    return {
+        "found": found,
+        "gesture": gesture,
+        "mode": mode,
+        "frames": frames,
+        "processed": processed,
+        "fps": fps,
+        "seconds": time.perf_counter() - started,
+        "stages": stages,
+        "worker": {"pid": pool["pid"], "warm": warm, "init_seconds": pool["init_seconds"]},
+    }
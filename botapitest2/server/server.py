@@ -1,130 +1,400 @@
-from fastapi import FastAPI, UploadFile, File
-import shutil
-import cv2
-import mediapipe as mp
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+import os
+import time
 import base64
 import uvicorn
 
-app = FastAPI()
+from cache import ResultCache
+from jobs import JobQueue, QueueFull
+from gestures import GESTURES
+from ingest import receive_video, probe_duration, UploadTooLarge, BadUpload
+from recognition import hand_rec_video, init_worker, warm_up, MODES
+from transcode import Transcoder, TranscodeError
+from workspace import Workspace, QuotaExceeded
+
+# Имена файлов внутри рабочей папки задачи
 file = "meow.mp4"
 out_vid_path = "reloadedmeow.mp4"
 out_photo_path = "photomeoq.jpeg"
+transcoded_path = "transcoded.mp4"
+
+# Очередь распознавания: число процессов, глубина очереди и таймаут задачи
+WORKERS = int(os.environ.get("REC_WORKERS", os.cpu_count() or 1))
+MAX_PENDING = int(os.environ.get("REC_MAX_PENDING", WORKERS * 4))
+JOB_TIMEOUT = float(os.environ.get("REC_JOB_TIMEOUT", 300))
+
+# Рабочие папки задач и их суммарный лимит на диске
+WORK_DIR = os.environ.get("REC_WORK_DIR", os.path.join(os.getcwd(), "jobs"))
+DISK_QUOTA = int(os.environ.get("REC_DISK_QUOTA", 2 * 1024 ** 3))
+
+# Кэш результатов по содержимому видео и его лимит на диске
+CACHE_DIR = os.environ.get("REC_CACHE_DIR", os.path.join(os.getcwd(), "cache"))
+CACHE_BYTES = int(os.environ.get("REC_CACHE_BYTES", 1024 ** 3))
+
+# Ограничения загрузки: размер видео в байтах и его длительность в секундах
+MAX_UPLOAD_BYTES = int(os.environ.get("REC_MAX_UPLOAD_BYTES", 100 * 1024 ** 2))
+MAX_VIDEO_SECONDS = float(os.environ.get("REC_MAX_VIDEO_SECONDS", 180))
+
+# Перекодирование размеченного видео (нужен ffmpeg, REC_TRANSCODE=0 - выключить):
+# число одновременных процессов ffmpeg, максимальная высота кадра, битрейт (кбит/с),
+# качество (crf, меньше - лучше и больше файл) и скорость сжатия (preset)
+transcoder = Transcoder(
+    ffmpeg=os.environ.get("REC_FFMPEG", "ffmpeg") if os.environ.get("REC_TRANSCODE", "1") == "1" else "",
+    workers=int(os.environ.get("REC_TRANSCODE_WORKERS", max(1, WORKERS // 2))),
+    max_height=int(os.environ.get("REC_MAX_HEIGHT", 720)),
+    max_kbps=int(os.environ.get("REC_MAX_KBPS", 1500)),
+    crf=int(os.environ.get("REC_CRF", 26)),
+    preset=os.environ.get("REC_PRESET", "veryfast"),
+)
+
+# Статистика пула: время загрузки моделей в процессах и время задач
+stats = {
+    "model_init_seconds": {},
+    "startup_seconds": None,
+    "jobs": {},
+    "cold_jobs": 0,
+    "job_seconds_total": 0.0,
+    "queue_wait_seconds_total": 0.0,
+    "recognition_seconds_total": 0.0,
+    "stage_seconds_total": {},
+    "videos": 0,
+    "video_bytes_total": 0,
+    "transcoded": 0,
+    "transcode_errors": 0,
+    "raw_video_bytes_total": 0,
+    "transcoded_video_bytes_total": 0,
+}
 
-def hand_rec_video(file, out_vid_path, out_photo_path):
-    res = []
-    k = 0
+
+def record_job(job):
+    stats["jobs"][job.status] = stats["jobs"].get(job.status, 0) + 1
+    if job.status != "done":
+        return
+    # Видео, которое не удалось перекодировать, не кэшируется: следующий запрос попробует ещё раз
+    if job.key is not None and "error" not in job.result.get("video", {}):
+        cache.put(job.key, job.workdir, (out_vid_path, out_photo_path), job.result)
+    stats["job_seconds_total"] += job.finished - job.started
+    stats["queue_wait_seconds_total"] += job.started - job.created
+    stats["recognition_seconds_total"] += job.result["seconds"]
+    for stage, seconds in job.result["stages"].items():
+        stats["stage_seconds_total"][stage] = stats["stage_seconds_total"].get(stage, 0.0) + seconds
+    video = job.result.get("video")
+    if video is not None:
+        stats["videos"] += 1
+        stats["video_bytes_total"] += video["bytes"]
+        if video["transcoded"]:
+            stats["transcoded"] += 1
+            stats["raw_video_bytes_total"] += video["raw_bytes"]
+            stats["transcoded_video_bytes_total"] += video["bytes"]
+        elif "error" in video:
+            stats["transcode_errors"] += 1
+    worker = job.result["worker"]
+    stats["model_init_seconds"][worker["pid"]] = worker["init_seconds"]
+    if not worker["warm"]:
+        stats["cold_jobs"] += 1
+
+
+workspace = Workspace(WORK_DIR, DISK_QUOTA)
+cache = ResultCache(CACHE_DIR, CACHE_BYTES)
+queue = JobQueue(WORKERS, MAX_PENDING, JOB_TIMEOUT,
+                 on_forget=lambda job: workspace.release(job.workdir),
+                 on_finish=record_job, initializer=init_worker)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    workspace.reset()
+    cache.load()
+    queue.start()
+    started = time.perf_counter()
+    for worker in await queue.warm_up(warm_up):
+        stats["model_init_seconds"][worker["pid"]] = worker["init_seconds"]
+    stats["startup_seconds"] = time.perf_counter() - started
     try:
-        video = cv2.VideoCapture(file)
-        hand = mp.solutions.hands.Hands(static_image_mode=False,
-                                        max_num_hands=1, min_detection_confidence=0.7, min_tracking_confidence=0.7)
-        mpDraw = mp.solutions.drawing_utils
-
-        colorgreen = [0, 200, 0]
-        colorred = [0, 0, 255]
-        radius = 10
-        index_open = False
-        middle_open = False
-        pinky_open = False
-        ring_open = False
-        thumb_open = False
-
-        # Используем mp4v для кодирования в mp4
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = None
-
-        while True:
-            ret, image = video.read()
-            if not ret:
-                break
-
-            if out is None:
-                h, w, _ = image.shape
-                # Указываем размер кадра как (ширина, высота) и fps
-                out = cv2.VideoWriter(out_vid_path, fourcc, 20.0, (w, h))
-
-            results = hand.process(image)
-            if results.multi_hand_landmarks:
-                for hand_landmarks in results.multi_hand_landmarks:
-                    mpDraw.draw_landmarks(image, results.multi_hand_landmarks[0], mp.solutions.hands.HAND_CONNECTIONS,
-                                          landmark_drawing_spec=mpDraw.DrawingSpec(color=(0, 0, 255)))
-                    for lm in hand_landmarks.landmark:
-                        a1, b2 = int(lm.x * w), int(lm.y * h)
-                        coordinates = (a1, b2)
-                        cv2.circle(image, coordinates, radius, colorred)
-
-                        index_coord6y = (
-                            int(results.multi_hand_landmarks[0].landmark[6].y * h))
-                        index_coord8y = (
-                            int(results.multi_hand_landmarks[0].landmark[8].y * h))
-
-                        middle_coord12y = (
-                            int(results.multi_hand_landmarks[0].landmark[12].y * h))
-
-                        pinky_coord20y = (
-                            int(results.multi_hand_landmarks[0].landmark[20].y * h))
-
-                        ring_coord16y = (
-                            int(results.multi_hand_landmarks[0].landmark[16].y * h))
-
-                        if index_coord6y < index_coord8y:
-                            index_open = False
-                        else:
-                            index_open = True
-                        if index_coord6y < middle_coord12y:
-                            middle_open = False
-                        else:
-                            middle_open = True
-                        if index_coord6y < ring_coord16y:
-                            ring_open = False
-                        else:
-                            ring_open = True
-                        if index_coord6y < pinky_coord20y:
-                            pinky_open = False
-                        else:
-                            pinky_open = True
-
-                        if ((index_open is True) and (middle_open is True) and (ring_open is False) and (pinky_open is False)):
-                            cv2.circle(image, coordinates, radius,
-                                       colorgreen, thickness=1)
-                            mpDraw.draw_landmarks(image, results.multi_hand_landmarks[0],
-                                                  mp.solutions.hands.HAND_CONNECTIONS,
-                                                  landmark_drawing_spec=mpDraw.DrawingSpec(color=(0, 200, 0)))
-                            if k == 0:
-                                print('Peace!')
-                                cv2.imwrite(out_photo_path, image)
-                                k += 1
-                            res.append('True')
-
-            out.write(image)  # Записываем кадр с отрисованными точками
-
-        out.release()
-        video.release()
-        cv2.destroyAllWindows()
+        yield
+    finally:
+        await queue.stop()
 
-    except Exception as e:
-        return str(f"Error: {e}")
-    if 'True' in res:
-        return [out_photo_path, out_vid_path]
-    else:
-        return False
-
-@app.post("/")
-async def upload_video(video: UploadFile = File(...)):
+app = FastAPI(lifespan=lifespan)
+
+
+def get_job(job_id):
+    job = queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+
+# Дообработка размеченного видео после распознавания: перекодирование
+# (если есть ffmpeg) и размер итогового файла. Ошибка перекодирования не
+# ломает задачу - остаётся видео в mp4v
+async def finish_video(workdir, result):
+    path = os.path.join(workdir, out_vid_path)
+    if not os.path.exists(path):
+        return result
+    video = {"transcoded": False}
+    if transcoder.enabled:
+        tmp = os.path.join(workdir, transcoded_path)
+        try:
+            info = await transcoder.run(path, tmp)
+            os.replace(tmp, path)
+            result["stages"]["transcode"] = info["seconds"]
+            video.update(transcoded=True, raw_bytes=info["input_bytes"])
+        except TranscodeError as e:
+            video["error"] = str(e)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    video["bytes"] = os.path.getsize(path)
+    result["video"] = video
+    return result
+
+
+# Параметры анализа: режим, шаг по кадрам и масштаб кадра для распознавания
+def check_params(mode, stride, scale, gesture="peace"):
+    if gesture not in GESTURES:
+        raise HTTPException(status_code=422, detail=f"Неизвестный жест: {gesture}")
+    if mode not in MODES:
+        raise HTTPException(status_code=422, detail=f"Неизвестный режим: {mode}")
+    if stride < 1:
+        raise HTTPException(status_code=422, detail="stride должен быть не меньше 1")
+    if not 0 < scale <= 1:
+        raise HTTPException(status_code=422, detail="scale должен быть в диапазоне (0, 1]")
+
+
+# Приём видео из тела запроса в отдельную папку: размер проверяется во время
+# приёма, длительность - по заголовку контейнера до распознавания
+async def ingest_video(request, workdir):
+    try:
+        upload = await receive_video(request, os.path.join(workdir, file), MAX_UPLOAD_BYTES,
+                                     reserve=lambda written: workspace.reserve(workdir, written))
+        workspace.finish(workdir)
+        duration = await asyncio.to_thread(probe_duration, upload.path)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"Видео больше {MAX_UPLOAD_BYTES} байт")
+    except QuotaExceeded:
+        raise no_space()
+    except BadUpload as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if duration is not None and duration > MAX_VIDEO_SECONDS:
+        raise HTTPException(status_code=413, detail=f"Видео длиннее {MAX_VIDEO_SECONDS:g} с")
+    return upload
+
+
+def queue_full():
+    return HTTPException(status_code=503, detail="Очередь распознавания заполнена, попробуйте позже",
+                         headers={"Retry-After": "10"})
+
+
+def no_space():
+    return HTTPException(status_code=507, detail="Недостаточно места для обработки видео",
+                         headers={"Retry-After": "30"})
+
+
+# Сохранение видео в отдельную папку и постановка задачи распознавания в очередь
+async def submit_video(request: Request, mode="full", stride=1, scale=1.0, gesture="peace"):
+    check_params(mode, stride, scale, gesture)
+    if not queue.has_room():
+        raise queue_full()
+    # Место под видео резервируется по Content-Length, при приёме без него
+    # (chunked) резерв растёт по мере записи
+    length = request.headers.get("content-length", "")
+    try:
+        workdir = workspace.create(min(int(length), MAX_UPLOAD_BYTES) if length.isdigit() else 0)
+    except QuotaExceeded:
+        raise no_space()
+    try:
+        # Хэш содержимого считается при приёме, по нему ищется готовый результат
+        upload = await ingest_video(request, workdir)
+        key = cache.key(upload.sha256, {"mode": mode, "stride": stride, "scale": scale, "gesture": gesture,
+                                             "video": transcoder.profile() if mode == "full" else None})
+        cached = cache.get(key)
+        if cached is not None:
+            workspace.release(workdir)
+            return queue.completed(cached["result"], workdir=cached["dir"], key=key)
+        # Пока видео принималось, очередь могли занять другие загрузки
+        try:
+            return queue.submit(hand_rec_video, os.path.join(workdir, file), os.path.join(workdir, out_vid_path),
+                                os.path.join(workdir, out_photo_path), mode, stride, scale, gesture,
+                                workdir=workdir, key=key,
+                                after=(lambda result: finish_video(workdir, result)) if mode == "full" else None)
+        except QueueFull:
+            raise queue_full()
+    except BaseException:
+        workspace.release(workdir)
+        raise
+
+
+# Тело запроса с видео читается вручную (ingest.py), поэтому в схеме OpenAPI
+# оно описано явно: multipart/form-data с файлом в поле video
+VIDEO_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["video"],
+    "properties": {"video": {"type": "string", "format": "binary"}},
+}}}}}
+
+
+# Постановка видео в очередь, сразу возвращает id задачи
+@app.post("/jobs", openapi_extra=VIDEO_BODY)
+async def create_job(request: Request, mode: str = "full", stride: int = 1, scale: float = 1.0,
+                     gesture: str = "peace"):
+    return (await submit_video(request, mode, stride, scale, gesture)).info()
+
+
+# Статус задачи
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return get_job(job_id).info()
+
+
+# Ожидание завершения задачи (не дольше timeout секунд)
+@app.get("/jobs/{job_id}/wait")
+async def job_wait(job_id: str, timeout: float = 30):
+    job = await queue.wait(get_job(job_id), timeout)
+    return job.info()
+
+
+# Файл результата задачи. Отдаётся с диска потоком, поддерживаются Range-запросы
+def job_artifact(job_id, name, media_type):
+    job = get_job(job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Задача ещё не готова: {job.status}")
+    path = os.path.join(job.workdir, name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Файл не найден")
+    return FileResponse(path, media_type=media_type, filename=name)
+
+
+# Размеченное видео
+@app.get("/jobs/{job_id}/video")
+async def job_video(job_id: str):
+    return job_artifact(job_id, out_vid_path, "video/mp4")
+
+
+# Кадр с найденным жестом
+@app.get("/jobs/{job_id}/photo")
+async def job_photo(job_id: str):
+    return job_artifact(job_id, out_photo_path, "image/jpeg")
+
+
+# Готовый результат по ключу кэша (из ответа /jobs), без повторной загрузки видео
+@app.get("/cache/{key}")
+async def cached_job(key: str):
+    cached = cache.get(key)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Результата нет в кэше")
+    return queue.completed(cached["result"], workdir=cached["dir"], key=key).info()
+
+
+# Статистика пула моделей: время загрузки при старте и среднее время задачи
+@app.get("/stats")
+async def pool_stats():
+    done = stats["jobs"].get("done", 0)
+    return {
+        "workers": queue.workers,
+        "pending": queue.pending,
+        "startup_seconds": stats["startup_seconds"],
+        "model_init_seconds": stats["model_init_seconds"],
+        "jobs": stats["jobs"],
+        "cold_jobs": stats["cold_jobs"],
+        "avg_job_seconds": stats["job_seconds_total"] / done if done else None,
+        "avg_recognition_seconds": stats["recognition_seconds_total"] / done if done else None,
+        "avg_queue_wait_seconds": stats["queue_wait_seconds_total"] / done if done else None,
+        "avg_stage_seconds": {stage: seconds / done for stage, seconds in stats["stage_seconds_total"].items()},
+        "video": {
+            "transcode": transcoder.profile(),
+            "videos": stats["videos"],
+            "avg_bytes": stats["video_bytes_total"] / stats["videos"] if stats["videos"] else None,
+            "transcoded": stats["transcoded"],
+            "transcode_errors": stats["transcode_errors"],
+            # Во сколько раз перекодирование уменьшило файл (по перекодированным видео)
+            "compression_ratio": (stats["raw_video_bytes_total"] / stats["transcoded_video_bytes_total"]
+                                  if stats["transcoded_video_bytes_total"] else None),
+        },
+        "cache": {
+            "hits": cache.hits,
+            "misses": cache.misses,
+            "hit_ratio": cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else None,
+            "entries": len(cache),
+            "bytes": cache.size,
+        },
+    }
+
+
+# Те же данные в формате Prometheus
+@app.get("/metrics")
+async def metrics():
+    done = stats["jobs"].get("done", 0)
+    lines = [
+        "# TYPE recognition_workers gauge",
+        f"recognition_workers {queue.workers}",
+        "# TYPE recognition_pending_jobs gauge",
+        f"recognition_pending_jobs {queue.pending}",
+        "# TYPE recognition_jobs_total counter",
+        *(f'recognition_jobs_total{{status="{status}"}} {count}' for status, count in sorted(stats["jobs"].items())),
+        "# TYPE recognition_cold_jobs_total counter",
+        f"recognition_cold_jobs_total {stats['cold_jobs']}",
+        "# TYPE recognition_job_seconds summary",
+        f"recognition_job_seconds_sum {stats['job_seconds_total']}",
+        f"recognition_job_seconds_count {done}",
+        "# TYPE recognition_queue_wait_seconds summary",
+        f"recognition_queue_wait_seconds_sum {stats['queue_wait_seconds_total']}",
+        f"recognition_queue_wait_seconds_count {done}",
+        "# TYPE recognition_stage_seconds summary",
+        *(line for stage, seconds in sorted(stats["stage_seconds_total"].items())
+          for line in (f'recognition_stage_seconds_sum{{stage="{stage}"}} {seconds}',
+                       f'recognition_stage_seconds_count{{stage="{stage}"}} {done}')),
+        "# TYPE recognition_video_bytes summary",
+        f"recognition_video_bytes_sum {stats['video_bytes_total']}",
+        f"recognition_video_bytes_count {stats['videos']}",
+        "# TYPE recognition_transcode_total counter",
+        f'recognition_transcode_total{{result="ok"}} {stats["transcoded"]}',
+        f'recognition_transcode_total{{result="error"}} {stats["transcode_errors"]}',
+        "# TYPE recognition_transcode_input_bytes_total counter",
+        f"recognition_transcode_input_bytes_total {stats['raw_video_bytes_total']}",
+        "# TYPE recognition_transcode_output_bytes_total counter",
+        f"recognition_transcode_output_bytes_total {stats['transcoded_video_bytes_total']}",
+        "# TYPE recognition_cache_lookups_total counter",
+        f'recognition_cache_lookups_total{{result="hit"}} {cache.hits}',
+        f'recognition_cache_lookups_total{{result="miss"}} {cache.misses}',
+        "# TYPE recognition_cache_bytes gauge",
+        f"recognition_cache_bytes {cache.size}",
+        "# TYPE recognition_workspace_bytes gauge",
+        f"recognition_workspace_bytes {workspace.usage()}",
+    ]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+# Отмена задачи
+@app.delete("/jobs/{job_id}")
+async def job_cancel(job_id: str):
+    get_job(job_id)
+    return {"cancelled": queue.cancel(job_id)}
+
+
+@app.post("/", openapi_extra=VIDEO_BODY)
+async def upload_video(request: Request, stride: int = 1, scale: float = 1.0):
     try:
-        with open(f"{video.filename}", "wb") as buffer:
-            shutil.copyfileobj(video.file, buffer)
-        
-        hand_rec_video(file, out_vid_path, out_photo_path)
+        job = await submit_video(request, "full", stride, scale)
+        try:
+            await queue.wait(job)
+            if job.status != "done":
+                return {"error": f"Произошла ошибка при обработке видео: {job.error or job.status}"}
 
-        with open(out_vid_path, "rb") as video_file:
-            video_data = base64.b64encode(video_file.read()).decode('utf-8')
+            with open(os.path.join(job.workdir, out_vid_path), "rb") as video_file:
+                video_data = base64.b64encode(video_file.read()).decode('utf-8')
 
-        with open(out_photo_path, "rb") as image_file:
-            image_data = base64.b64encode(image_file.read()).decode('utf-8')
+            with open(os.path.join(job.workdir, out_photo_path), "rb") as image_file:
+                image_data = base64.b64encode(image_file.read()).decode('utf-8')
+        finally:
+            queue.forget(job.id)
 
         data = {"video": video_data, "image": image_data}
 
         return data
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": f"Произошла ошибка при загрузке файла: {str(e)}"}
-    
\ No newline at end of file
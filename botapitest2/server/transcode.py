@@ -0,0 +1,71 @@
+import asyncio
+import os
+import shutil
+import time
+
+
+class TranscodeError(Exception):
+    pass
+
+
+# Перекодирование размеченного видео в H.264 для отправки в Telegram:
+# fps исходника сохраняется, высота кадра и битрейт ограничены, moov-атом
+# переносится в начало файла (faststart), чтобы видео начинало играть до
+# полной загрузки. ffmpeg запускается отдельным процессом, одновременно -
+# не больше workers процессов; без ffmpeg перекодирование выключено
+class Transcoder:
+    def __init__(self, ffmpeg="ffmpeg", workers=1, max_height=720, max_kbps=1500, crf=26, preset="veryfast"):
+        self.ffmpeg = shutil.which(ffmpeg)
+        self.workers = workers
+        self.max_height = max_height
+        self.max_kbps = max_kbps
+        self.crf = crf
+        self.preset = preset
+        self._slots = None
+
+    @property
+    def enabled(self):
+        return self.ffmpeg is not None
+
+    # Настройки, от которых зависит результат (входят в ключ кэша)
+    def profile(self):
+        if not self.enabled:
+            return None
+        return {"codec": "h264", "max_height": self.max_height, "max_kbps": self.max_kbps,
+                "crf": self.crf, "preset": self.preset}
+
+    def command(self, src, dst):
+        return [
+            self.ffmpeg, "-nostdin", "-y", "-loglevel", "error", "-i", src,
+            # Кадр уменьшается до max_height, но не увеличивается; ширина и высота чётные
+            # (с нечётными libx264 в yuv420p не работает)
+            "-vf", f"scale=-2:'min({self.max_height},trunc(ih/2)*2)':flags=bicubic",
+            "-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf),
+            "-maxrate", f"{self.max_kbps}k", "-bufsize", f"{self.max_kbps * 2}k",
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart", "-an", dst,
+        ]
+
+    # Перекодирование src в dst. Возвращает время и размеры файлов до и после
+    async def run(self, src, dst):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        async with self._slots:
+            started = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(*self.command(src, dst),
+                                                           stdout=asyncio.subprocess.DEVNULL,
+                                                           stderr=asyncio.subprocess.PIPE)
+            try:
+                _, stderr = await process.communicate()
+            except BaseException:
+                # Отмена задачи (в том числе по таймауту): процесс не должен остаться висеть
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                raise
+            if process.returncode != 0:
+                raise TranscodeError(stderr.decode(errors="replace").strip()[-500:] or f"ffmpeg: код {process.returncode}")
+            return {
+                "seconds": time.perf_counter() - started,
+                "input_bytes": os.path.getsize(src),
+                "output_bytes": os.path.getsize(dst),
+            }
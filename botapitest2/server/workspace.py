@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+
+
+# На сколько байт минимум расширяется резерв папки, когда запись его превысила
+RESERVE_STEP = 1024 * 1024
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+# Рабочие папки задач: у каждой задачи своя временная папка внутри root,
+# суммарный размер всех папок ограничен quota_bytes. Пока в папку идёт
+# запись (приём видео), место под неё резервируется, чтобы одновременные
+# загрузки не прошли проверку квоты все разом
+class Workspace:
+    def __init__(self, root, quota_bytes):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        # папка -> [зарезервировано байт, записано байт]
+        self._reserved = {}
+
+    # Удаление папок, оставшихся от прошлого запуска
+    def reset(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+
+    def usage(self):
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+        return total
+
+    # Зарезервированное, но ещё не записанное место
+    def reserved(self):
+        return sum(max(reserved - written, 0) for reserved, written in self._reserved.values())
+
+    # Проверка, что ещё extra байт поместятся в квоту
+    def ensure_space(self, extra=0):
+        if self.usage() + self.reserved() + extra > self.quota_bytes:
+            raise QuotaExceeded()
+
+    # Новая папка с резервом reserve байт под запись
+    def create(self, reserve=0):
+        self.ensure_space(reserve)
+        path = tempfile.mkdtemp(prefix="job-", dir=self.root)
+        self._reserved[path] = [reserve, 0]
+        return path
+
+    # В папку записано уже written байт: если резерв превышен, он расширяется
+    # (не меньше чем на RESERVE_STEP) с проверкой квоты
+    def reserve(self, path, written):
+        item = self._reserved[path]
+        item[1] = written
+        if written > item[0]:
+            extra = max(written - item[0], RESERVE_STEP)
+            self.ensure_space(extra)
+            item[0] += extra
+
+    # Запись в папку закончена, дальше её место считает usage()
+    def finish(self, path):
+        self._reserved.pop(path, None)
+
+    def release(self, path):
+        self.finish(path)
+        if path and os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.root):
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,177 @@
+# cache.py
+
+# Кэш частых запросов бота (юзер, соревнование, статус результата).
+# Значения хранятся в JSON-виде, поэтому хранилище можно заменить:
+# MemoryCache - в памяти процесса, RedisCache - общий для нескольких процессов,
+# NullCache - без кэша
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+
+# Хранилище в памяти процесса: TTL у каждой записи и вытеснение давно не использованных
+class MemoryCache:
+    def __init__(self, max_items = 10000):
+        self.max_items = max_items
+        self._items = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    # (найдено ли, значение)
+    async def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return False, None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._items[key]
+            return False, None
+        self._items.move_to_end(key)
+        return True, value
+
+    async def set(self, key, value, ttl):
+        self._items[key] = (time.monotonic() + ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last = False)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._items.pop(key, None)
+
+    async def clear(self):
+        self._items.clear()
+
+
+# Кэш выключен: каждое чтение идёт в БД
+class NullCache:
+    def __len__(self):
+        return 0
+
+    async def get(self, key):
+        return False, None
+
+    async def set(self, key, value, ttl):
+        pass
+
+    async def delete(self, *keys):
+        pass
+
+    async def clear(self):
+        pass
+
+
+# Общее хранилище в Redis (нужен пакет redis)
+class RedisCache:
+    def __init__(self, url, prefix = "osport:"):
+        from redis import asyncio as aioredis
+        self.client = aioredis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key):
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return False, None
+        return True, json.loads(raw)
+
+    async def set(self, key, value, ttl):
+        await self.client.set(self.prefix + key, json.dumps(value), ex = max(1, int(ttl)))
+
+    async def delete(self, *keys):
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+    async def clear(self):
+        async for key in self.client.scan_iter(match = self.prefix + "*"):
+            await self.client.delete(key)
+
+
+# Хранилище по адресу: "memory", "none" или redis://...
+def create_backend(url, max_items = 10000):
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url)
+    if url == "none":
+        return NullCache()
+    return MemoryCache(max_items)
+
+
+# Чтение через кэш. Пустые ответы (юзера нет и т.п.) тоже кэшируются,
+# но на меньшее время negative_ttl. Ошибки хранилища не ломают запрос:
+# значение просто читается из БД
+class ReadThroughCache:
+    def __init__(self, backend, ttl = 60, negative_ttl = 10):
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+        self._loading = {}
+
+    # Значение по ключу, при промахе - из loader(). Одновременные промахи
+    # по одному ключу ждут один и тот же loader
+    async def fetch(self, key, loader, is_empty = lambda value: not value):
+        try:
+            found, value = await self.backend.get(key)
+        except Exception:
+            self.errors += 1
+            return await loader()
+        if found:
+            self.hits += 1
+            if is_empty(value):
+                self.negative_hits += 1
+            return value
+
+        self.misses += 1
+        if key in self._loading:
+            loading = self._loading[key]
+            await asyncio.wait([loading])
+            if loading.cancelled():
+                return await loader()
+            return loading.result()
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        invalidations = self.invalidations
+        try:
+            value = await loader()
+            # Если за время загрузки что-то поменялось, значение могло устареть
+            if invalidations == self.invalidations:
+                try:
+                    await self.backend.set(key, value, self.negative_ttl if is_empty(value) else self.ttl)
+                except Exception:
+                    self.errors += 1
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._loading[key]
+
+    # Сброс ключей после изменения данных
+    async def invalidate(self, *keys):
+        self.invalidations += 1
+        try:
+            await self.backend.delete(*keys)
+        except Exception:
+            self.errors += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "errors": self.errors,
+            "invalidations": self.invalidations,
+            "entries": len(self.backend) if hasattr(self.backend, "__len__") else None,
+        }
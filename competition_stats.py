@@ -0,0 +1,84 @@
+# competition_stats.py
+
+# Сводка по каждому соревнованию (участники, проверенные и ожидающие
+# результаты, сумма и среднее повторений). Обновляется при каждой записи
+# результата, как и рейтинги, поэтому читается без запросов к БД
+
+# Статус проверенного результата (его ставит /editCountResult)
+VERIFIED = "✅"
+
+
+class CompetitionStats:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # competition_id -> [участники, проверенные, результаты с count, сумма count]
+        self._competitions = {}
+        self._results = {}
+        self._members = set()
+
+    def __len__(self):
+        return len(self._competitions)
+
+    def rebuild(self, rows):
+        self.clear()
+        for row in rows:
+            self.apply(*row)
+
+    # Добавление или изменение результата
+    def apply(self, result_id, competition_id, telegram_id, count, status):
+        self.remove(result_id)
+        self._results[result_id] = (competition_id, telegram_id, count, status)
+        self._members.add((competition_id, telegram_id))
+        self._add(competition_id, count, status, 1)
+
+    # Удаление результата
+    def remove(self, result_id):
+        old = self._results.pop(result_id, None)
+        if old is None:
+            return
+        competition_id, telegram_id, count, status = old
+        self._members.discard((competition_id, telegram_id))
+        self._add(competition_id, count, status, -1)
+
+    def is_member(self, competition_id, telegram_id):
+        return (competition_id, telegram_id) in self._members
+
+    def get(self, competition_id):
+        members, verified, counted, total = self._competitions.get(competition_id, (0, 0, 0, 0))
+        return {
+            "competition_id": competition_id,
+            "members": members,
+            "verified": verified,
+            "pending": members - verified,
+            "total_count": total,
+            "average_count": total / counted if counted else None,
+        }
+
+    # Сравнение со сводкой, посчитанной в БД: rows - строки
+    # (competition_id, members, verified, counted, total_count).
+    # Возвращает соревнования, где значения расходятся
+    def diff(self, rows):
+        expected = {row[0]: tuple(row[1:]) for row in rows}
+        mismatches = []
+        for competition_id in sorted(expected.keys() | self._competitions.keys()):
+            actual = tuple(self._competitions.get(competition_id, (0, 0, 0, 0)))
+            stored = tuple(value or 0 for value in expected.get(competition_id, (0, 0, 0, 0)))
+            if actual != stored:
+                mismatches.append({"competition_id": competition_id, "memory": actual, "database": stored})
+        return mismatches
+
+    def _add(self, competition_id, count, status, sign):
+        item = self._competitions.setdefault(competition_id, [0, 0, 0, 0])
+        item[0] += sign
+        if status == VERIFIED:
+            item[1] += sign
+        if count is not None:
+            item[2] += sign
+            item[3] += sign * count
+        if item[0] == 0:
+            del self._competitions[competition_id]
+
+
+competition_stats = CompetitionStats()
@@ -0,0 +1,6 @@
+# database
+
+# Слой доступа к данным: модели, функции-репозитории (users, competitions,
+# results, idempotency), которые принимают сессию и не коммитят, и единица работы для коммита
+from database.models import Base, Users, Competitions, Results, IdempotencyKeys, RESULT_KEY_COLUMNS
+from database.unit_of_work import UnitOfWork, record_changes
@@ -0,0 +1,54 @@
+# database/competitions.py
+
+# Сторонние модули
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Созданные модули
+from database.models import Competitions, Results, RESULT_KEY_COLUMNS
+from database.unit_of_work import record_changes
+
+
+# Добавление соревнования, возвращает его id
+async def add(session: AsyncSession, data: dict):
+    query = insert(Competitions).values(**data).returning(Competitions.competition_id)
+    rows = (await session.execute(query)).all()
+    record_changes(session, "competition", rows)
+    return rows[0].competition_id
+
+
+# Удаление соревнования
+async def remove(session: AsyncSession, competition_id: int):
+    # Результаты соревнования удаляются явно, а не только каскадом в БД, чтобы
+    # после коммита их убрали из рейтингов и сводок в памяти
+    query = delete(Results).where(Results.competition_id == competition_id).returning(*RESULT_KEY_COLUMNS)
+    record_changes(session, "result_deleted", (await session.execute(query)).all())
+    query = delete(Competitions).where(Competitions.competition_id == competition_id).returning(Competitions.competition_id)
+    rows = (await session.execute(query)).all()
+    record_changes(session, "competition", rows)
+    return rows
+
+
+# Изменение соревнования; пустой список, если его нет
+async def edit(session: AsyncSession, competition_id: int, data: dict):
+    query = update(Competitions).where(
+        Competitions.competition_id == competition_id).values(**data).returning(Competitions.competition_id)
+    rows = (await session.execute(query)).all()
+    record_changes(session, "competition", rows)
+    return rows
+
+
+# id первого соревнования
+async def first_id(session: AsyncSession):
+    return (await session.execute(select(Competitions.competition_id))).scalar()
+
+
+# Соревнование по id (строка со всеми колонками) или None
+async def get(session: AsyncSession, competition_id: int):
+    query = select(*Competitions.__table__.c).where(Competitions.competition_id == competition_id)
+    return (await session.execute(query)).first()
+
+
+# Запрос всех соревнований (для постраничной или потоковой выдачи)
+def list_query():
+    return select(*Competitions.__table__.c)
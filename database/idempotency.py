@@ -0,0 +1,35 @@
+# database/idempotency.py
+
+# Стандартные модули
+from datetime import datetime, timedelta, timezone
+
+# Сторонние модули
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Созданные модули
+from database.models import IdempotencyKeys, insert_missing
+
+
+# Занять ключ. None - ключ новый и занят этой транзакцией, иначе строка
+# (request_hash, result_id) с прошлого запроса. В Postgres одновременный
+# запрос с тем же ключом ждёт здесь, пока первый не закончит транзакцию
+async def claim(session: AsyncSession, key: str, request_hash: str):
+    query = insert_missing(session.get_bind().dialect.name, IdempotencyKeys,
+                           {"key": key, "request_hash": request_hash}).returning(IdempotencyKeys.key)
+    if (await session.execute(query)).first() is not None:
+        return None
+    query = select(IdempotencyKeys.request_hash, IdempotencyKeys.result_id).where(IdempotencyKeys.key == key)
+    return (await session.execute(query)).one()
+
+
+# Запомнить, какой результат записан по ключу
+async def complete(session: AsyncSession, key: str, result_id: int):
+    await session.execute(update(IdempotencyKeys).where(IdempotencyKeys.key == key).values(result_id = result_id))
+
+
+# Удаление ключей старше seconds секунд
+async def purge(session: AsyncSession, seconds: float):
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds = seconds)
+    query = delete(IdempotencyKeys).where(IdempotencyKeys.created < cutoff)
+    return (await session.execute(query)).rowcount
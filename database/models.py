@@ -0,0 +1,120 @@
+# database/models.py
+
+# Сторонние модули
+from sqlalchemy import ForeignKey, BigInteger, Integer, Text, String, DateTime, Date, Index, func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import relationship, DeclarativeBase, Mapped, mapped_column
+
+
+class Base(DeclarativeBase):
+    created: Mapped[DateTime] = mapped_column(
+                                DateTime(timezone = True),
+                                default = func.now()
+                            )
+    
+    updated: Mapped[DateTime] = mapped_column(
+                                DateTime(timezone = True),
+                                default = func.now(),
+                                onupdate = func.now()
+                            )
+
+
+# id в Telegram не помещаются в 32 бита (в SQLite INTEGER и так 64-битный)
+TelegramId = BigInteger().with_variant(Integer, "sqlite")
+
+
+class Users(Base):
+    __tablename__ = "users"
+
+    telegram_id: Mapped[int] = mapped_column(TelegramId, primary_key = True, unique = True, autoincrement = False)
+    telegram_link: Mapped[str] = mapped_column(String(100), nullable = False)
+    first_name: Mapped[str] = mapped_column(String(100), nullable = False)
+    last_name: Mapped[str] = mapped_column(String(100), nullable = True)
+    birth_date: Mapped[Date] = mapped_column(Date, nullable = False)
+    sex: Mapped[str] = mapped_column(String(1), nullable = False)
+
+
+class Competitions(Base):
+    __tablename__ = "competitions"
+
+    competition_id: Mapped[int] = mapped_column(primary_key = True, autoincrement = True)
+    title: Mapped[str] = mapped_column(String(100), nullable = False)
+    password: Mapped[str] = mapped_column(Text, nullable = True)
+    video_instruction: Mapped[str] = mapped_column(Text, nullable = False)
+
+
+class Results(Base):
+    __tablename__ = "results"
+    __table_args__ = (
+        # У юзера один результат в соревновании; индекс покрывает выборки по соревнованию
+        Index("uq_results_competition_telegram", "competition_id", "telegram_id", unique = True),
+        Index("ix_results_telegram_id", "telegram_id"),
+        Index("ix_results_competition_count", "competition_id", "count"),
+        # Постраничная выдача результатов соревнования по result_id
+        Index("ix_results_competition_result", "competition_id", "result_id"),
+    )
+
+    result_id: Mapped[int] = mapped_column(primary_key = True, autoincrement = True)
+
+    competition_id: Mapped[int] = mapped_column(
+        ForeignKey(Competitions.competition_id, ondelete = "CASCADE"),
+        nullable = False
+    )
+
+    telegram_id: Mapped[int] = mapped_column(
+        ForeignKey(Users.telegram_id, ondelete = "CASCADE"),
+        nullable = False
+    )
+    
+    video: Mapped[str] = mapped_column(Text, nullable = False)
+    count: Mapped[int] = mapped_column(Integer, nullable = True)
+    status: Mapped[str] = mapped_column(String(1), nullable = False)
+
+
+    competition: Mapped["Competitions"] = relationship(
+        backref = "results", foreign_keys = [competition_id], cascade = "all, delete"
+    )
+    
+    user: Mapped["Users"] = relationship(
+        backref = "results", foreign_keys = [telegram_id], cascade = "all, delete"
+    )
+
+
+# Колонки результата, по которым обновляются рейтинги
+RESULT_KEY_COLUMNS = (Results.result_id, Results.competition_id, Results.telegram_id, Results.count, Results.status)
+
+
+# Ключи идемпотентности: повтор запроса с тем же ключом не записывает
+# результат ещё раз, а возвращает уже записанный
+class IdempotencyKeys(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("ix_idempotency_keys_created", "created"),
+    )
+
+    key: Mapped[str] = mapped_column(String(200), primary_key = True)
+    # sha256 тела запроса: тот же ключ с другими данными - ошибка клиента
+    request_hash: Mapped[str] = mapped_column(String(64), nullable = False)
+    result_id: Mapped[int] = mapped_column(Integer, nullable = True)
+
+
+# INSERT ... ON CONFLICT есть только в диалектах SQLite и Postgres, поэтому insert берётся по диалекту
+def _dialect_insert(dialect_name: str, model):
+    dialect_insert = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}.get(dialect_name)
+    if dialect_insert is None:
+        raise NotImplementedError(f"INSERT ... ON CONFLICT не поддерживается для {dialect_name}")
+    return dialect_insert(model)
+
+
+# INSERT нескольких строк с обновлением существующих по ключу keys
+def upsert(dialect_name: str, model, rows: list, keys: list, columns: list):
+    query = _dialect_insert(dialect_name, model).values(rows)
+    values = {column: query.excluded[column] for column in columns}
+    values["updated"] = func.now()
+    return query.on_conflict_do_update(index_elements = keys, set_ = values)
+
+
+# INSERT строки, если строки с таким же ключом ещё нет
+def insert_missing(dialect_name: str, model, values: dict):
+    return _dialect_insert(dialect_name, model).values(**values).on_conflict_do_nothing()
@@ -0,0 +1,181 @@
+# database/results.py
+
+# Сторонние модули
+from sqlalchemy import select, insert, delete, update, and_, case, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Созданные модули
+from database.models import Results, RESULT_KEY_COLUMNS, upsert
+from database.unit_of_work import record_changes
+
+# Сколько id передаётся в одном запросе (лимит параметров SQLite - 32766,
+# а в UPDATE ... CASE на каждый id уходит по три параметра)
+CHUNK = 500
+
+
+# Изменения результатов попадают в сессию, рейтинги обновляются после коммита
+def _saved(session: AsyncSession, rows):
+    record_changes(session, "result", rows)
+    return rows
+
+
+# Добавление результата в БД
+async def add(session: AsyncSession, data: dict):
+    query = insert(Results).values(
+        competition_id = data["competition_id"],
+        telegram_id = data["telegram_id"],
+        video = data["video"],
+        count = data["count"],
+        status = data["status"]
+    ).returning(*RESULT_KEY_COLUMNS)
+
+    return _saved(session, (await session.execute(query)).all())
+
+
+# Изменение результата юзера по определённому соревнованию
+async def edit(session: AsyncSession, competition_id: int, telegram_id: int, data: dict):
+    query = update(Results).where(
+        and_(
+            Results.competition_id == competition_id,
+            Results.telegram_id == telegram_id
+        )
+    ).values(
+        video = data["video"],
+        count = data["count"],
+        status = data["status"]
+    ).returning(*RESULT_KEY_COLUMNS)
+
+    return _saved(session, (await session.execute(query)).all())
+
+
+# Обнуление количества повторений
+async def set_null_count(session: AsyncSession, result_id: int):
+    query = update(Results).where(
+        Results.result_id == result_id).values(count = None).returning(*RESULT_KEY_COLUMNS)
+
+    return _saved(session, (await session.execute(query)).all())
+
+
+# Изменяем количество повторений
+async def edit_count(session: AsyncSession, result_id: int, new_count: int):
+    query = update(Results).where(
+        Results.result_id == result_id).values(
+            count = new_count, status = "✅"
+        ).returning(*RESULT_KEY_COLUMNS)
+
+    return _saved(session, (await session.execute(query)).all())
+
+
+# Изменяем количество повторений у многих результатов: counts - {result_id: count}.
+# Один UPDATE ... SET count = CASE result_id WHEN ... END на каждые CHUNK результатов
+async def edit_counts(session: AsyncSession, counts: dict):
+    rows = []
+    items = list(counts.items())
+    for start in range(0, len(items), CHUNK):
+        chunk = dict(items[start:start + CHUNK])
+        query = update(Results).where(
+            Results.result_id.in_(chunk)).values(
+                count = case(chunk, value = Results.result_id), status = "✅"
+            ).returning(*RESULT_KEY_COLUMNS)
+        rows.extend((await session.execute(query)).all())
+    return _saved(session, rows)
+
+
+# Удаление результата юзера
+async def delete_res(session: AsyncSession, result_id: int):
+    query = delete(Results).where(Results.result_id == result_id).returning(*RESULT_KEY_COLUMNS)
+    rows = (await session.execute(query)).all()
+    record_changes(session, "result_deleted", rows)
+    return rows
+
+
+# Добавление или обновление нескольких результатов одним запросом
+# (у юзера один результат в соревновании)
+async def upsert_many(session: AsyncSession, rows: list):
+    query = upsert(session.get_bind().dialect.name, Results, rows,
+                   ["competition_id", "telegram_id"], ["video", "count", "status"]).returning(*RESULT_KEY_COLUMNS)
+    return _saved(session, (await session.execute(query)).all())
+
+
+# Запись результата юзера в соревновании одним запросом: новый добавляется,
+# существующий обновляется. Возвращает строку со всеми колонками
+async def submit(session: AsyncSession, data: dict):
+    query = upsert(session.get_bind().dialect.name, Results, [data],
+                   ["competition_id", "telegram_id"], ["video", "count", "status"]).returning(*Results.__table__.c)
+    return _saved(session, (await session.execute(query)).all())[0]
+
+
+# Запрос результатов (для постраничной или потоковой выдачи), можно
+# ограничить юзером и/или соревнованием
+def list_query(telegram_id: int = None, competition_id: int = None):
+    query = select(*Results.__table__.c)
+    if telegram_id is not None:
+        query = query.where(Results.telegram_id == telegram_id)
+    if competition_id is not None:
+        query = query.where(Results.competition_id == competition_id)
+    return query
+
+
+# Результат по id или None
+async def get(session: AsyncSession, result_id: int):
+    return (await session.execute(list_query().where(Results.result_id == result_id))).first()
+
+
+# Выборка результата юзера по определённому соревнованию
+async def get_user(session: AsyncSession, competition_id: int, telegram_id: int):
+    query = list_query(telegram_id, competition_id)
+    return (await session.execute(query)).first()
+
+
+# Выборка id всех участников определённого соревнования
+async def competition_members(session: AsyncSession, competition_id: int):
+    query = select(Results.telegram_id).where(
+        Results.competition_id == competition_id
+    )
+
+    result = await session.execute(query)
+    return result.scalars().all()
+
+
+# Выборка статуса
+async def check_status(session: AsyncSession, competition_id: int, telegram_id: int):
+    query = select(Results.status).where(
+        and_(
+            Results.competition_id == competition_id,
+            Results.telegram_id == telegram_id
+        )
+    )
+
+    result = await session.execute(query)
+    return result.scalars().all()
+
+
+# Результаты по id в заданном порядке (по частям, чтобы не упереться в лимит параметров)
+async def load(session: AsyncSession, result_ids: list):
+    rows = {}
+    for start in range(0, len(result_ids), CHUNK):
+        query = list_query().where(
+            Results.result_id.in_(result_ids[start:start + CHUNK])
+        )
+        result = await session.execute(query)
+        rows.update((row.result_id, row) for row in result)
+    return [rows[result_id] for result_id in result_ids if result_id in rows]
+
+
+# Ключевые колонки всех результатов (для загрузки рейтингов)
+async def key_rows(session: AsyncSession):
+    return (await session.execute(select(*RESULT_KEY_COLUMNS))).all()
+
+
+# Сводка по соревнованиям, посчитанная в БД: строки (competition_id, участники,
+# результаты со статусом verified_status, результаты с count, сумма count)
+async def competition_summary(session: AsyncSession, verified_status: str):
+    query = select(
+        Results.competition_id,
+        func.count(),
+        func.count(case((Results.status == verified_status, 1))),
+        func.count(Results.count),
+        func.sum(Results.count)
+    ).group_by(Results.competition_id)
+
+    return (await session.execute(query)).all()
@@ -0,0 +1,42 @@
+# database/unit_of_work.py
+
+# Сторонние модули
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+
+# Запись изменения в сессии: kind - что изменилось ("user", "competition",
+# "result", "result_deleted"), rows - строки с ключами. Функции репозиториев
+# вызывают её сами, а обработчик after_commit получает все изменения после коммита
+def record_changes(session: AsyncSession, kind: str, rows):
+    session.info.setdefault("changes", []).extend((kind, row) for row in rows)
+
+
+# Единица работы: одна сессия и одна транзакция на несколько вызовов
+# репозиториев. Изменения пишутся одним коммитом, а after_commit(changes)
+# вызывается только после успешного коммита (рейтинги, сброс кэша и т.п.).
+# Если выйти из блока без commit(), транзакция откатывается
+class UnitOfWork:
+    def __init__(self, session_factory: async_sessionmaker, after_commit = None):
+        self.session_factory = session_factory
+        self.after_commit = after_commit
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = self.session_factory()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        try:
+            await self.session.rollback()
+        finally:
+            await self.session.close()
+
+    async def commit(self):
+        await self.session.commit()
+        changes = self.session.info.pop("changes", [])
+        if self.after_commit is not None and changes:
+            await self.after_commit(changes)
+
+    async def rollback(self):
+        await self.session.rollback()
+        self.session.info.pop("changes", None)
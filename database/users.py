@@ -0,0 +1,55 @@
+# database/users.py
+
+# Сторонние модули
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Созданные модули
+from database.models import Users, Results, RESULT_KEY_COLUMNS, upsert
+from database.unit_of_work import record_changes
+
+
+# Добавление юзера
+async def add(session: AsyncSession, data: dict):
+    rows = (await session.execute(insert(Users).values(**data).returning(Users.telegram_id))).all()
+    record_changes(session, "user", rows)
+
+
+# Юзер по telegram_id (строка со всеми колонками) или None
+async def get(session: AsyncSession, telegram_id: int):
+    query = select(*Users.__table__.c).where(Users.telegram_id == telegram_id)
+    return (await session.execute(query)).first()
+
+
+# Запрос всех юзеров (для постраничной или потоковой выдачи)
+def list_query():
+    return select(*Users.__table__.c)
+
+
+# Обновление даты рождения
+async def update_birth_date(session: AsyncSession, telegram_id: int, birth_date):
+    query = update(Users).where(Users.telegram_id == telegram_id).values(birth_date = birth_date).returning(Users.telegram_id)
+    rows = (await session.execute(query)).all()
+    record_changes(session, "user", rows)
+    return rows
+
+
+# Удаление юзера
+async def remove(session: AsyncSession, telegram_id: int):
+    # Результаты юзера удаляются явно, а не только каскадом в БД, чтобы
+    # после коммита их убрали из рейтингов и сводок в памяти
+    query = delete(Results).where(Results.telegram_id == telegram_id).returning(*RESULT_KEY_COLUMNS)
+    record_changes(session, "result_deleted", (await session.execute(query)).all())
+    query = delete(Users).where(Users.telegram_id == telegram_id).returning(Users.telegram_id)
+    rows = (await session.execute(query)).all()
+    record_changes(session, "user", rows)
+    return rows
+
+
+# Добавление или обновление нескольких юзеров одним запросом
+async def upsert_many(session: AsyncSession, rows: list):
+    columns = [column for column in rows[0] if column != "telegram_id"]
+    query = upsert(session.get_bind().dialect.name, Users, rows, ["telegram_id"], columns).returning(Users.telegram_id)
+    saved = (await session.execute(query)).all()
+    record_changes(session, "user", saved)
+    return saved
@@ -0,0 +1,134 @@
+# leaderboard.py
+
+# Рейтинги, которые поддерживаются в памяти и обновляются при каждой
+# записи результата, чтобы чтение рейтинга не сортировало таблицу results
+from bisect import bisect_left, insort
+
+
+# Набор id, отсортированный по значению от большего к меньшему.
+# При равных значениях выше тот, у кого меньше id
+class RankedSet:
+    def __init__(self):
+        self._keys = []
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, item_id):
+        return item_id in self._values
+
+    def value(self, item_id):
+        return self._values.get(item_id)
+
+    def set(self, item_id, value):
+        self.discard(item_id)
+        insort(self._keys, (-value, item_id))
+        self._values[item_id] = value
+
+    def discard(self, item_id):
+        if item_id not in self._values:
+            return
+        value = self._values.pop(item_id)
+        del self._keys[bisect_left(self._keys, (-value, item_id))]
+
+    # Место в рейтинге, начиная с 1
+    def rank(self, item_id):
+        if item_id not in self._values:
+            return None
+        return bisect_left(self._keys, (-self._values[item_id], item_id)) + 1
+
+    # Страница рейтинга: список (id, значение)
+    def page(self, offset = 0, limit = None):
+        end = None if limit is None else offset + limit
+        return [(item_id, -value) for value, item_id in self._keys[offset:end]]
+
+
+# Рейтинг по каждому соревнованию (result_id по count)
+# и общий рейтинг (telegram_id по сумме count подтверждённых результатов)
+class Leaderboards:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.competitions = {}
+        self.total = RankedSet()
+        self._results = {}
+        self._members = {}
+        self._total_results = {}
+
+    def __len__(self):
+        return len(self._results)
+
+    def rebuild(self, rows):
+        self.clear()
+        for row in rows:
+            self.apply(*row)
+
+    # Добавление или изменение результата
+    def apply(self, result_id, competition_id, telegram_id, count, status):
+        self.remove(result_id)
+        self._results[result_id] = (competition_id, telegram_id, count, status)
+        self._members[(competition_id, telegram_id)] = result_id
+        if count is not None:
+            self.competitions.setdefault(competition_id, RankedSet()).set(result_id, count)
+        if self._in_total(count, status):
+            self._add_total(telegram_id, count, 1)
+
+    # Удаление результата
+    def remove(self, result_id):
+        old = self._results.pop(result_id, None)
+        if old is None:
+            return
+        competition_id, telegram_id, count, status = old
+        if self._members.get((competition_id, telegram_id)) == result_id:
+            del self._members[(competition_id, telegram_id)]
+        ranked = self.competitions.get(competition_id)
+        if ranked is not None:
+            ranked.discard(result_id)
+            if not ranked:
+                del self.competitions[competition_id]
+        if self._in_total(count, status):
+            self._add_total(telegram_id, -count, -1)
+
+    def competition_page(self, competition_id, offset = 0, limit = None):
+        ranked = self.competitions.get(competition_id)
+        if ranked is None:
+            return []
+        return ranked.page(offset, limit)
+
+    def competition_size(self, competition_id):
+        ranked = self.competitions.get(competition_id)
+        return 0 if ranked is None else len(ranked)
+
+    # Место и результат юзера в соревновании
+    def competition_rank(self, competition_id, telegram_id):
+        result_id = self._members.get((competition_id, telegram_id))
+        ranked = self.competitions.get(competition_id)
+        if result_id is None or ranked is None or result_id not in ranked:
+            return None
+        return ranked.rank(result_id), ranked.value(result_id)
+
+    def total_page(self, offset = 0, limit = None):
+        return self.total.page(offset, limit)
+
+    def total_rank(self, telegram_id):
+        if telegram_id not in self.total:
+            return None
+        return self.total.rank(telegram_id), self.total.value(telegram_id)
+
+    @staticmethod
+    def _in_total(count, status):
+        return status is not None and count is not None and count > 0
+
+    def _add_total(self, telegram_id, delta, results_delta):
+        results = self._total_results.get(telegram_id, 0) + results_delta
+        if results == 0:
+            self._total_results.pop(telegram_id, None)
+            self.total.discard(telegram_id)
+            return
+        self._total_results[telegram_id] = results
+        self.total.set(telegram_id, (self.total.value(telegram_id) or 0) + delta)
+
+
+leaderboards = Leaderboards()
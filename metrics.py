@@ -0,0 +1,163 @@
+# metrics.py
+
+# Метрики сервера в текстовом формате Prometheus (отдаются на /metrics).
+# Счётчики и гистограммы с метками, значения хранятся в памяти процесса
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Границы корзин гистограмм задержек, в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+# Значение, которое считается в момент выдачи метрик: collect() -> {(метки): значение}.
+# kind="counter" - для счётчиков, которые ведутся в другом месте
+class Gauge:
+    def __init__(self, name, help, labelnames = (), collect = None, kind = "gauge"):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self.kind = kind
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames = (), buckets = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики по корзинам (последняя - +Inf), сумма]
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        item = self._values.get(labels)
+        if item is None:
+            item = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        item[0][bisect_left(self.buckets, value)] += 1
+        item[1] += value
+
+    def count(self, *labels):
+        item = self._values.get(labels)
+        return sum(item[0]) if item else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_requests = Counter("http_requests_total", "HTTP-запросы по маршруту и коду ответа",
+                        ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "Время обработки HTTP-запроса",
+                         ("method", "route"))
+db_queries = Counter("db_queries_total", "SQL-запросы по типу", ("engine", "operation"))
+db_errors = Counter("db_errors_total", "SQL-запросы с ошибкой", ("engine",))
+db_latency = Histogram("db_query_duration_seconds", "Время выполнения SQL-запроса", ("engine", "operation"))
+db_checkout = Histogram("db_pool_checkout_seconds", "Ожидание соединения из пула (вместе с подключением)",
+                        ("engine",))
+
+# Движки, за пулами которых следят метрики: название -> движок
+_engines = {}
+db_pool_in_use = Gauge("db_pool_connections_in_use", "Выданные из пула соединения", ("engine",),
+                       lambda: {(name,): engine.pool.checkedout() for name, engine in _engines.items()
+                                if hasattr(engine.pool, "checkedout")})
+
+
+# Пул, который замеряет, сколько ждали соединение
+class TimedPool(AsyncAdaptedQueuePool):
+    metrics_name = "db"
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            db_checkout.observe(time.perf_counter() - started, self.metrics_name)
+
+
+# Класс пула для движка name (poolclass в create_async_engine). Название
+# хранится в классе, чтобы пережить пересоздание пула при engine.dispose()
+def timed_pool(name):
+    return type("TimedPool", (TimedPool,), {"metrics_name": name})
+
+
+# Подключение движка к метрикам: число и время SQL-запросов
+def instrument_engine(engine, name):
+    sync_engine = engine.sync_engine
+    _engines[name] = sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        db_queries.inc(name, operation)
+        db_latency.observe(time.perf_counter() - started, name, operation)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def on_error(context):
+        db_errors.inc(name)
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
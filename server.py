@@ -1,39 +1,120 @@
-from fastapi import FastAPI, Depends
-from pydantic import BaseModel
-from datetime import date
-from sqlalchemy import desc, ForeignKey, null, and_, Integer, Text, String, Column, create_engine, DateTime, Date, select, func, update, delete
+import asyncio
+import codecs
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
+from datetime import date, datetime
+from typing import Any
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, OperationalError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import relationship, sessionmaker, Session, DeclarativeBase, registry, Mapped, mapped_column
 
-app = FastAPI()
+import metrics
+from database import Base, Users, Competitions, Results, IdempotencyKeys, UnitOfWork
+from database import competitions as competitions_repo, idempotency, results as results_repo, users as users_repo
+from leaderboard import leaderboards
+from competition_stats import competition_stats, VERIFIED
+from cache import ReadThroughCache, create_backend
 
 # SQLALCHEMY
-engine = create_async_engine(
-    "sqlite+aiosqlite:///OSport.db", connect_args={"check_same_thread": False})
+# База задаётся адресом: sqlite+aiosqlite:///файл.db или postgresql+asyncpg://...
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite+aiosqlite:///OSport.db")
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+
+# Пул соединений для серверных СУБД: размер, сколько можно открыть сверх него,
+# проверка соединения перед выдачей, пересоздание старых соединений (сек.)
+# и кэш подготовленных запросов asyncpg (0 - выключен, нужно для pgbouncer)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_PRE_PING = os.environ.get("DB_PRE_PING", "1") == "1"
+DB_STATEMENT_CACHE_SIZE = os.environ.get("DB_STATEMENT_CACHE_SIZE")
+
+# Настройки SQLite для каждого соединения (переопределяются через SQLITE_<НАЗВАНИЕ>).
+# WAL - читатели не ждут писателя, busy_timeout - сколько мс ждать блокировку
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000)),
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -64000)),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 ** 2)),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+# Соединений в пуле для чтения
+SQLITE_READERS = int(os.environ.get("SQLITE_READERS", 4))
+
+def sqlite_engine(url, pool_size, pragmas, name = "db"):
+    engine = create_async_engine(
+        url, connect_args={"check_same_thread": False}, pool_size = pool_size, max_overflow = 0,
+        pool_pre_ping = DB_PRE_PING, poolclass = metrics.timed_pool(name))
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+def server_engine(url, name = "db"):
+    url = make_url(url)
+    if DB_STATEMENT_CACHE_SIZE is not None and url.get_driver_name() == "asyncpg":
+        url = url.update_query_dict({"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE})
+    return create_async_engine(
+        url, pool_size = DB_POOL_SIZE, max_overflow = DB_MAX_OVERFLOW, pool_timeout = DB_POOL_TIMEOUT,
+        pool_recycle = DB_POOL_RECYCLE, pool_pre_ping = DB_PRE_PING, poolclass = metrics.timed_pool(name))
+
+if IS_SQLITE:
+    # Все записи идут по очереди через одно соединение, поэтому писатели не
+    # получают "database is locked". GET-запросы читают через отдельный пул
+    # соединений, которым запрещена запись
+    engine = sqlite_engine(DATABASE_URL, 1, SQLITE_PRAGMAS, "write")
+    read_engine = sqlite_engine(DATABASE_URL, SQLITE_READERS, {**SQLITE_PRAGMAS, "query_only": "ON"}, "read")
+else:
+    # Серверная СУБД сама разруливает конкурентные записи. Чтение можно
+    # отправить на реплику через DATABASE_READ_URL
+    engine = server_engine(DATABASE_URL, "write")
+    read_engine = server_engine(os.environ["DATABASE_READ_URL"], "read") if os.environ.get("DATABASE_READ_URL") else engine
+metrics.instrument_engine(engine, "write")
+if read_engine is not engine:
+    metrics.instrument_engine(read_engine, "read")
 SessionLocal = async_sessionmaker(engine)
+ReadSessionLocal = async_sessionmaker(read_engine)
 
-# Описание класса USERS
-class Base(DeclarativeBase):
-    created: Mapped[DateTime] = mapped_column(
-                                DateTime(timezone = True),
-                                default = func.now()
-                            )
-    
-    updated: Mapped[DateTime] = mapped_column(
-                                DateTime(timezone = True),
-                                default = func.now(),
-                                onupdate = func.now()
-                            )
-
-class Users(Base):
-    __tablename__ = "users"
-
-    telegram_id: Mapped[int] = mapped_column(primary_key = True, unique = True)
-    telegram_link: Mapped[str] = mapped_column(String(100), nullable = False)
-    first_name: Mapped[str] = mapped_column(String(100), nullable = False)
-    last_name: Mapped[str] = mapped_column(String(100), nullable = True)
-    birth_date: Mapped[Date] = mapped_column(Date, nullable = False)
-    sex: Mapped[str] = mapped_column(String(1), nullable = False)
+# Сколько процессов сервера работает с базой (uvicorn и gunicorn берут число
+# воркеров из WEB_CONCURRENCY). Если их несколько или база серверная (с ней могут
+# работать и другие экземпляры сервера), кэш и рейтинги в памяти процесса
+# не видят чужих записей
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", 1))
+SHARED_DATABASE = not IS_SQLITE or WEB_CONCURRENCY > 1
+
+# Кэш частых запросов: CACHE_URL - "memory" (в процессе), redis://... (общий
+# для нескольких процессов) или "none" (без кэша, по умолчанию при общей базе),
+# время жизни записи и записи "не найдено"
+CACHE_URL = os.environ.get("CACHE_URL", "none" if SHARED_DATABASE else "memory")
+cache = ReadThroughCache(
+    create_backend(CACHE_URL, int(os.environ.get("CACHE_MAX_ITEMS", 10000))),
+    ttl = float(os.environ.get("CACHE_TTL", 60)),
+    negative_ttl = float(os.environ.get("CACHE_NEGATIVE_TTL", 10)))
+
+def user_key(telegram_id):
+    return f"user:{telegram_id}"
+
+def competition_key(competition_id):
+    return f"competition:{competition_id}"
+
+def status_key(competition_id, telegram_id):
+    return f"status:{competition_id}:{telegram_id}"
 
 # PYDANTIC
 class UserBase(BaseModel):
@@ -43,200 +124,448 @@ class UserBase(BaseModel):
     last_name: str
     birth_date: date
     sex: str
-    # created: date
-    # updated: date
 
-# Подключение к БД и создание сессии
-async def get_db():
+# Модели ответов: строки из БД (ORM-объекты или строки запроса по колонкам)
+class UserOut(UserBase):
+    model_config = ConfigDict(from_attributes = True)
+
+    last_name: str | None
+    created: datetime | None = None
+    updated: datetime | None = None
+
+# Ответ из строк запросов по колонкам. Данные уже приведены к типам колонок,
+# поэтому они не проверяются моделью ещё раз и не проходят через jsonable_encoder,
+# а сразу кодируются pydantic-core. Модели ответов указаны в response_model для документации
+JSON = TypeAdapter(Any)
+
+def json_response(value):
+    return Response(JSON.dump_json(value), media_type = "application/json")
+
+def as_dicts(rows):
+    return [row._asdict() for row in rows]
+
+def as_dict(row):
+    return row._asdict() if row is not None else None
+
+# Миграции схемы: (версия, функция). Каждая применяется один раз, номер
+# последней применённой хранится в таблице schema_version
+def _migration_1(conn):
+    Base.metadata.create_all(conn)
+
+# Индексы для results. Перед созданием уникального индекса из дубликатов
+# (соревнование, юзер) остаётся один результат: проверенный, затем с count,
+# затем последний. Остальные переносятся в таблицу results_duplicates
+# (колонки как в results) и перечисляются в логе, а не удаляются бесследно
+def _migration_2(conn):
+    duplicates = (
+        "SELECT result_id FROM (SELECT result_id, ROW_NUMBER() OVER ("
+        "PARTITION BY competition_id, telegram_id ORDER BY "
+        "CASE WHEN status = :verified THEN 0 ELSE 1 END, "
+        "CASE WHEN count IS NULL THEN 1 ELSE 0 END, result_id DESC) AS n "
+        "FROM results) ranked WHERE n > 1"
+    )
+    rows = conn.execute(text(
+        "SELECT result_id, competition_id, telegram_id, count, status FROM results "
+        f"WHERE result_id IN ({duplicates}) ORDER BY competition_id, telegram_id, result_id"
+    ), {"verified": VERIFIED}).all()
+    if rows:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS results_duplicates AS SELECT * FROM results WHERE 1 = 0"))
+        conn.execute(text(
+            f"INSERT INTO results_duplicates SELECT * FROM results WHERE result_id IN ({duplicates})"
+        ), {"verified": VERIFIED})
+        conn.execute(text("DELETE FROM results WHERE result_id IN (SELECT result_id FROM results_duplicates)"))
+        print(f"Миграция 2: {len(rows)} повторных результатов перенесено в results_duplicates")
+        for row in rows:
+            print(f"  result_id={row.result_id} competition_id={row.competition_id} "
+                  f"telegram_id={row.telegram_id} count={row.count} status={row.status}")
+    for index in Results.__table__.indexes:
+        index.create(conn, checkfirst = True)
+
+# Таблица ключей идемпотентности для /submitResult
+def _migration_3(conn):
+    IdempotencyKeys.__table__.create(conn, checkfirst = True)
+
+# Индекс для постраничной выдачи /getCompetitionResult (competition_id, result_id)
+def _migration_4(conn):
+    for index in Results.__table__.indexes:
+        if index.name == "ix_results_competition_result":
+            index.create(conn, checkfirst = True)
+
+MIGRATIONS = [
+    (1, _migration_1),
+    (2, _migration_2),
+    (3, _migration_3),
+    (4, _migration_4),
+]
+
+def run_migrations(conn):
+    # Несколько процессов могут стартовать одновременно: в Postgres миграции
+    # выполняет один, остальные ждут блокировку до конца его транзакции
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('osport_migrations'))"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    current = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    for version, migration in MIGRATIONS:
+        if version > current:
+            migration(conn)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+
+# Сколько секунд запрос ждёт окончания запуска, прежде чем получить 503
+READY_TIMEOUT = 30
+ready = asyncio.Event()
+
+# Рейтинги и сводки по соревнованиям хранятся в памяти каждого процесса. Если база
+# общая (см. SHARED_DATABASE), они перечитываются из базы каждые LEADERBOARD_REFRESH
+# секунд, чтобы видеть записи других процессов (0 - не перечитывать)
+LEADERBOARD_REFRESH = float(os.environ.get("LEADERBOARD_REFRESH", 5 if SHARED_DATABASE else 0))
+
+# Изменения результатов, применённые, пока идёт перечитывание: после пересборки
+# они применяются ещё раз, иначе снимок, прочитанный до них, затёр бы их
+_changes_during_load = []
+
+async def load_leaderboards():
+    changes = []
+    _changes_during_load.append(changes)
+    try:
+        async with ReadSessionLocal() as db:
+            rows = await results_repo.key_rows(db)
+    finally:
+        _changes_during_load.remove(changes)
+    leaderboards.rebuild(rows)
+    competition_stats.rebuild(rows)
+    for kind, row in changes:
+        apply_result_change(kind, row)
+
+async def refresh_leaderboards():
+    while True:
+        await asyncio.sleep(LEADERBOARD_REFRESH)
+        try:
+            await load_leaderboards()
+        except Exception as e:
+            print(f"Не удалось обновить рейтинги: {e}")
+
+# Ключи идемпотентности хранятся IDEMPOTENCY_TTL секунд, старые удаляются раз в час
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", 24 * 3600))
+
+async def purge_idempotency_keys():
+    while True:
+        try:
+            async with SessionLocal() as db, db.begin():
+                await idempotency.purge(db, IDEMPOTENCY_TTL)
+        except Exception as e:
+            print(f"Не удалось удалить старые ключи идемпотентности: {e}")
+        await asyncio.sleep(3600)
+
+# Запуск и остановка приложения: схема создаётся и мигрируется один раз
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SHARED_DATABASE and CACHE_URL == "memory":
+        print("Внимание: кэш в памяти процесса при общей базе, изменения из других процессов "
+              "видны только через CACHE_TTL секунд. Задайте CACHE_URL=redis://... или none")
+    if SHARED_DATABASE and LEADERBOARD_REFRESH <= 0:
+        print("Внимание: рейтинги не перечитываются при общей базе и не увидят "
+              "записей других процессов. Задайте LEADERBOARD_REFRESH")
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-
-    db = SessionLocal()
+        await conn.run_sync(run_migrations)
+    await load_leaderboards()
+    refresher = asyncio.create_task(refresh_leaderboards()) if LEADERBOARD_REFRESH > 0 else None
+    purger = asyncio.create_task(purge_idempotency_keys())
+    ready.set()
+    try:
+        yield
+    finally:
+        ready.clear()
+        if refresher is not None:
+            refresher.cancel()
+        purger.cancel()
+        await engine.dispose()
+        if read_engine is not engine:
+            await read_engine.dispose()
+
+app = FastAPI(lifespan = lifespan)
+
+# Запросы ждут, пока не закончится запуск (миграции и т.п.)
+@app.middleware("http")
+async def readiness_gate(request: Request, call_next):
+    if not ready.is_set() and request.url.path != "/ready":
+        try:
+            await asyncio.wait_for(ready.wait(), READY_TIMEOUT)
+        except asyncio.TimeoutError:
+            return JSONResponse(status_code = 503, content = {"error": "Сервер ещё запускается"})
+    return await call_next(request)
+
+# Время и код ответа каждого запроса. Маршрут берётся шаблоном (/getUser),
+# а не фактическим путём, чтобы число меток не росло
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.http_latency.observe(time.perf_counter() - started, request.method, path)
+        metrics.http_requests.inc(request.method, path, str(status))
+
+# Ответ с ошибкой: тело как раньше ({"error": ...}), но с настоящим кодом:
+# 409 - конфликт с данными в БД, 503 - БД занята/недоступна, ошибки клиента
+# (запись не найдена, неверные данные) обработчики бросают как HTTPException
+# с нужным кодом. Всё остальное - ошибка сервера (500)
+def error_response(message: str, e: Exception):
+    detail = str(e)
+    if isinstance(e, HTTPException):
+        status, detail = e.status_code, e.detail
+    elif isinstance(e, IntegrityError):
+        status = 409
+    elif isinstance(e, OperationalError):
+        status = 503
+    else:
+        status = 500
+    return JSONResponse(status_code = status, content = {"error": f"{message}: {detail}"})
+
+# Проверка готовности сервера
+@app.get('/ready')
+async def readiness():
+    return ready.is_set()
+
+# Изменение результата в рейтингах и сводках
+def apply_result_change(kind, row):
+    if kind == "result":
+        leaderboards.apply(row.result_id, row.competition_id, row.telegram_id, row.count, row.status)
+        competition_stats.apply(row.result_id, row.competition_id, row.telegram_id, row.count, row.status)
+    else:
+        leaderboards.remove(row.result_id)
+        competition_stats.remove(row.result_id)
+
+# После коммита: рейтинги и сброс кэша по изменённым строкам (см. database.record_changes)
+async def apply_changes(changes):
+    keys = set()
+    for kind, row in changes:
+        if kind in ("result", "result_deleted"):
+            apply_result_change(kind, row)
+            for pending in _changes_during_load:
+                pending.append((kind, row))
+            keys.add(status_key(row.competition_id, row.telegram_id))
+        elif kind == "user":
+            keys.add(user_key(row.telegram_id))
+        elif kind == "competition":
+            keys.add(competition_key(row.competition_id))
+    if keys:
+        await cache.invalidate(*keys)
+
+# Единица работы для изменений: после коммита обновляются рейтинги и сбрасывается кэш
+def unit_of_work():
+    return UnitOfWork(SessionLocal, after_commit = apply_changes)
+
+async def get_uow():
+    async with unit_of_work() as uow:
+        yield uow
+
+# Сессия только для чтения
+async def get_read_db():
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
         await db.close()
 
+# Keyset-пагинация: строки с ключом больше after_id, не больше limit штук
+def keyset(query, key, after_id = None, limit = None):
+    if after_id is not None:
+        query = query.where(key > after_id)
+    if after_id is not None or limit is not None:
+        query = query.order_by(key)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+# Ключ для следующей страницы передаётся в заголовке X-Next-After
+def set_next_after(response: Response, rows, key: str, limit):
+    if rows and limit is not None and len(rows) == limit:
+        response.headers["X-Next-After"] = str(getattr(rows[-1], key))
+
+# Потоковая выдача в NDJSON: строки читаются из БД порциями и сразу отправляются.
+# Сессия открывается внутри генератора, так как живёт дольше обработчика
+STREAM_BATCH = 1000
+
+def ndjson_response(query):
+    async def lines():
+        async with ReadSessionLocal() as db:
+            result = await db.stream(query.execution_options(yield_per = STREAM_BATCH))
+            async for rows in result.mappings().partitions():
+                yield b"".join(JSON.dump_json(dict(row)) + b"\n" for row in rows)
+    return StreamingResponse(lines(), media_type = "application/x-ndjson")
+
+# Потоковая выдача в CSV с заголовком из названий колонок
+def csv_response(query):
+    async def lines():
+        async with ReadSessionLocal() as db:
+            result = await db.stream(query.execution_options(yield_per = STREAM_BATCH))
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(result.keys())
+            async for row in result:
+                writer.writerow(row)
+                if buffer.tell() > 64 * 1024:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+    return StreamingResponse(lines(), media_type = "text/csv")
+
 # , response_model=UserBase - добавить в запрос, если необходимо возвращать данные определенного вида
 # Добавление юзера в БД
 @app.post('/userAdd')
-async def add_user(user: UserBase, db: AsyncSession = Depends(get_db)):
+async def add_user(user: UserBase, uow: UnitOfWork = Depends(get_uow)):
     try:
-        db_user = Users(**user.dict())
-        db.add(db_user)
-        await db.commit()
-        await db.refresh(db_user)
+        await users_repo.add(uow.session, user.model_dump())
+        await uow.commit()
         return "Пользователь добавлен :3"
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении пользователя: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении пользователя", e)
+
+# Юзер из кэша (None, если его нет)
+async def cached_user(db: AsyncSession, telegram_id: int):
+    async def load():
+        return JSON.dump_python(as_dict(await users_repo.get(db, telegram_id)), mode = "json")
+    return await cache.fetch(user_key(telegram_id), load)
 
 # Получение пользователя
-@app.post('/getUser')
-async def get_user(telegram_id:int, db: AsyncSession = Depends(get_db)):
+@app.post('/getUser', response_model = list[UserOut])
+async def get_user(telegram_id:int, db: AsyncSession = Depends(get_read_db)):
     try:
-        results = await db.execute(select(Users).where(Users.telegram_id == telegram_id))
-        user = results.scalars().all()
-        return user
+        user = await cached_user(db, telegram_id)
+        return [user] if user is not None else []
     except Exception as e:
-        return {"error": f"Произошла ошибка при получении пользователя: {str(e)}"}
+        return error_response("Произошла ошибка при получении пользователя", e)
 
 # Получение всех пользователей
-@app.get('/getUsers')
-async def get_users(db: AsyncSession = Depends(get_db)):
+@app.get('/getUsers', response_model = dict[str, list[UserOut]])
+async def get_users(after_id: int | None = Query(None, ge = 0), limit: int | None = Query(None, ge = 1), stream: bool = False, db: AsyncSession = Depends(get_read_db)):
     try:
-        results = await db.execute(select(Users))
-        users = results.scalars().all()
-        return {"users":users}
+        query = keyset(users_repo.list_query(), Users.telegram_id, after_id, limit)
+        if stream:
+            return ndjson_response(query)
+        users = (await db.execute(query)).all()
+        response = json_response({"users": as_dicts(users)})
+        set_next_after(response, users, "telegram_id", limit)
+        return response
     except Exception as e:
-        return {"error": f"Произошла ошибка при получении пользователей: {str(e)}"}
+        return error_response("Произошла ошибка при получении пользователей", e)
     
 # Обновление ДР
 @app.post('/updateBirthDate')
-async def update_birth_date(telegram_id:int, new_birth_date:date, db: AsyncSession = Depends(get_db)):
+async def update_birth_date(telegram_id:int, new_birth_date:date, uow: UnitOfWork = Depends(get_uow)):
     try:
-        query = update(Users).where(Users.telegram_id == telegram_id).values(birth_date = new_birth_date)
-        await db.execute(query)
-        await db.commit()
+        await users_repo.update_birth_date(uow.session, telegram_id, new_birth_date)
+        await uow.commit()
         return "Дата рождения успешно обновлена!"
     except Exception as e:
-        return {"error": f"Произошла ошибка при обновлении Др: {str(e)}"}
+        return error_response("Произошла ошибка при обновлении Др", e)
 
 # Удаление пользователя из БД
 @app.delete('/deleteUser')
-async def delete_user(telegram_id:int, db: AsyncSession = Depends(get_db)):
+async def delete_user(telegram_id:int, uow: UnitOfWork = Depends(get_uow)):
     try:
-        query = delete(Users).where(Users.telegram_id == telegram_id)
-        await db.execute(query)
-        await db.commit()
+        await users_repo.remove(uow.session, telegram_id)
+        await uow.commit()
         return "Пользователь успешно удалён!"
     except Exception as e:
-        return {"error": f"Произошла ошибка при удалении: {str(e)}"}
+        return error_response("Произошла ошибка при удалении", e)
     
 # Проверка на наличие в БД
 @app.get('/chekUser')
-async def chek_user(telegram_id:int, db: AsyncSession = Depends(get_db)):
+async def chek_user(telegram_id:int, db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Users).where(Users.telegram_id == telegram_id)
-        result = await db.execute(query)
-        if result.first() is None:
-            return False
-        return True
+        return await cached_user(db, telegram_id) is not None
     except Exception as e:
-        return {"error": f"Произошла ошибка при удалении: {str(e)}"}
+        return error_response("Произошла ошибка при удалении", e)
     
 
 
 
-class Competitions(Base):
-    __tablename__ = "competitions"
-
-    competition_id: Mapped[int] = mapped_column(primary_key = True, autoincrement = True)
-    title: Mapped[str] = mapped_column(String(100), nullable = False)
-    password: Mapped[str] = mapped_column(Text, nullable = True)
-    video_instruction: Mapped[str] = mapped_column(Text, nullable = False)
-
 class CompetitionBase(BaseModel):
     title: str
     password: str
     video_instruction: str
 
+class CompetitionOut(CompetitionBase):
+    model_config = ConfigDict(from_attributes = True)
+
+    competition_id: int
+    password: str | None
+    created: datetime | None = None
+    updated: datetime | None = None
+
 # Добавление нового соревнования в БД
 @app.post('/addCompetition')
-async def add_competition(competition:CompetitionBase, db: AsyncSession = Depends(get_db)):
+async def add_competition(competition:CompetitionBase, uow: UnitOfWork = Depends(get_uow)):
     try:
-        db_competition=Competitions(**competition.dict())
-        db.add(db_competition)
-        await db.commit()
-        await db.refresh(db_competition)
+        await competitions_repo.add(uow.session, competition.model_dump())
+        await uow.commit()
         return "Соревнование добавлено :3"
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
     
 # Удаление определённого соревнования
 @app.post('/deleteCompetition')
-async def delete_competition(competition_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_competition(competition_id: int, uow: UnitOfWork = Depends(get_uow)):
     try:
-        del_from_competitions = delete(Competitions).where(Competitions.competition_id == competition_id)
-        # del_from_results = delete(Results).where(Results.competition_id == competition_id)
-        await db.execute(del_from_competitions)
-        # await session.execute(del_from_results)
-        await db.commit()
+        await competitions_repo.remove(uow.session, competition_id)
+        await uow.commit()
         return "Соревнование удалено :3"
     except Exception as e:
-        return {"error": f"Произошла ошибка при удалении: {str(e)}"}
+        return error_response("Произошла ошибка при удалении", e)
 
 # Изменение определённого соревнования
 @app.put('/editCompetition')
-async def edit_competition(competition_id: int, competition:CompetitionBase, db: AsyncSession = Depends(get_db)):
+async def edit_competition(competition_id: int, competition:CompetitionBase, uow: UnitOfWork = Depends(get_uow)):
     try:
-        db_competition = await db.get(Competitions, competition_id)
-        for field, value in competition.dict().items():
-            setattr(db_competition, field, value)
-        await db.commit()
+        if not await competitions_repo.edit(uow.session, competition_id, competition.model_dump()):
+            raise HTTPException(status_code = 404, detail = f"Соревнование {competition_id} не найдено")
+        await uow.commit()
         return "Соревнование обновлено :3"
     except Exception as e:
-        return {"error": f"Произошла ошибка при обновлении: {str(e)}"}
+        return error_response("Произошла ошибка при обновлении", e)
     
 # Выборка id первого соревнования в БД
 @app.get('/getFirstId')
-async def get_first_id(db: AsyncSession = Depends(get_db)):
+async def get_first_id(db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Competitions.competition_id)
-        result = await db.execute(query)
-        return result.scalar()
+        return await competitions_repo.first_id(db)
     except Exception as e:
-        return {"error": f"Произошла ошибка при обновлении: {str(e)}"}
+        return error_response("Произошла ошибка при обновлении", e)
 
 # Выборка определённого соревнования
-@app.get('/getCompetition')
-async def get_competition(competition_id: int, db: AsyncSession = Depends(get_db)):
+@app.get('/getCompetition', response_model = CompetitionOut | None)
+async def get_competition(competition_id: int, db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Competitions).where(Competitions.competition_id == competition_id)
-        result = await db.execute(query)
-        return result.scalar()
+        async def load():
+            row = await competitions_repo.get(db, competition_id)
+            return JSON.dump_python(as_dict(row), mode = "json")
+        return await cache.fetch(competition_key(competition_id), load)
     except Exception as e:
-        return {"error": f"Произошла ошибка при обновлении: {str(e)}"}
+        return error_response("Произошла ошибка при обновлении", e)
     
 # Выборка всех соревнований
-@app.get('/getAllCompetition')
-async def get_all_competition(db: AsyncSession = Depends(get_db)):
+@app.get('/getAllCompetition', response_model = list[CompetitionOut])
+async def get_all_competition(after_id: int | None = Query(None, ge = 0), limit: int | None = Query(None, ge = 1), stream: bool = False, db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Competitions)
-        result = await db.execute(query)
-        return result.scalars().all()
+        query = keyset(competitions_repo.list_query(), Competitions.competition_id, after_id, limit)
+        if stream:
+            return ndjson_response(query)
+        competitions = (await db.execute(query)).all()
+        response = json_response(as_dicts(competitions))
+        set_next_after(response, competitions, "competition_id", limit)
+        return response
     except Exception as e:
-        return {"error": f"Произошла ошибка при обновлении: {str(e)}"}
+        return error_response("Произошла ошибка при обновлении", e)
 
 
 
-class Results(Base):
-    __tablename__ = "results"
-
-    result_id: Mapped[int] = mapped_column(primary_key = True, autoincrement = True)
-
-    competition_id: Mapped[int] = mapped_column(
-        ForeignKey(Competitions.competition_id, ondelete = "CASCADE"),
-        nullable = False
-    )
-
-    telegram_id: Mapped[int] = mapped_column(
-        ForeignKey(Users.telegram_id, ondelete = "CASCADE"),
-        nullable = False
-    )
-    
-    video: Mapped[str] = mapped_column(Text, nullable = False)
-    count: Mapped[int] = mapped_column(Integer, nullable = True)
-    status: Mapped[str] = mapped_column(String(1), nullable = False)
-
-
-    competition: Mapped["Competitions"] = relationship(
-        backref = "results", foreign_keys = [competition_id], cascade = "all, delete"
-    )
-    
-    user: Mapped["Users"] = relationship(
-        backref = "results", foreign_keys = [telegram_id], cascade = "all, delete"
-    )
-
 class ResultsBase(BaseModel):
         competition_id: int
         telegram_id: int
@@ -244,139 +573,371 @@ class ResultsBase(BaseModel):
         count: int
         status: str
 
+class ResultOut(ResultsBase):
+    model_config = ConfigDict(from_attributes = True)
+
+    result_id: int
+    count: int | None
+    created: datetime | None = None
+    updated: datetime | None = None
+
 # Добавление результата в БД
 @app.post('/addResult')
-async def add_result(result:ResultsBase, db: AsyncSession = Depends(get_db)):
+async def add_result(result:ResultsBase, uow: UnitOfWork = Depends(get_uow)):
     try:
-        db_result=Results(**result.dict())
-        db.add(db_result)
-        await db.commit()
-        await db.refresh(db_result)
+        await results_repo.add(uow.session, result.model_dump())
+        await uow.commit()
         return "Результат добавлен :3"
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
     
+# Новые значения результата для /editResult
+class ResultEdit(BaseModel):
+    video: str
+    count: int | None
+    status: str
+
+class SubmitResultOut(BaseModel):
+    result: ResultOut | None
+    rank: int | None
+    members: int
+    replayed: bool
+
+# Запись результата одним запросом вместо /chekStatus + /addResult или /editResult:
+# результат юзера в соревновании добавляется или обновляется, в ответе строка
+# и место в рейтинге. С заголовком Idempotency-Key повтор запроса (например,
+# после обрыва связи) ничего не пишет и возвращает уже записанный результат
+@app.post('/submitResult', response_model = SubmitResultOut)
+async def submit_result(result: ResultsBase, idempotency_key: str | None = Header(None, max_length = 200),
+                        uow: UnitOfWork = Depends(get_uow)):
+    try:
+        data = result.model_dump()
+        replayed = False
+        if idempotency_key is None:
+            row = await results_repo.submit(uow.session, data)
+        else:
+            request_hash = hashlib.sha256(JSON.dump_json(data)).hexdigest()
+            stored = await idempotency.claim(uow.session, idempotency_key, request_hash)
+            if stored is None:
+                row = await results_repo.submit(uow.session, data)
+                await idempotency.complete(uow.session, idempotency_key, row.result_id)
+            elif stored.request_hash != request_hash:
+                raise HTTPException(status_code = 422, detail = "Idempotency-Key уже использован с другими данными")
+            else:
+                row = await results_repo.get(uow.session, stored.result_id) if stored.result_id is not None else None
+                replayed = True
+        await uow.commit()
+        rank = leaderboards.competition_rank(result.competition_id, result.telegram_id)
+        return json_response({
+            "result": as_dict(row),
+            "rank": rank[0] if rank is not None else None,
+            "members": leaderboards.competition_size(result.competition_id),
+            "replayed": replayed,
+        })
+    except Exception as e:
+        return error_response("Произошла ошибка при добавлении", e)
+
 # Изменение результата в БД
 @app.post('/editResult')
-async def edit_result(competition_id: int, telegram_id: int, data: dict, db: AsyncSession = Depends(get_db)):
+async def edit_result(competition_id: int, telegram_id: int, data: ResultEdit, uow: UnitOfWork = Depends(get_uow)):
     try:
-        query = update(Results).where(and_(Results.competition_id == competition_id,Results.telegram_id == telegram_id)).values(video = data["video"],count = data["count"],status = data["status"])
-        await db.execute(query)
-        await db.commit()
+        await results_repo.edit(uow.session, competition_id, telegram_id, data.model_dump())
+        await uow.commit()
         return "Результат изменен"
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
     
 # Обнуление количества повторений
 @app.post('/setNullResult')
-async def set_null_result(result_id: int, db: AsyncSession = Depends(get_db)):
+async def set_null_result(result_id: int, uow: UnitOfWork = Depends(get_uow)):
     try:
-        query = update(Results).where(Results.result_id == result_id).values(count = None)
-        await db.execute(query)
-        await db.commit()
+        await results_repo.set_null_count(uow.session, result_id)
+        await uow.commit()
         return "Результат обнулен"
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
     
 # Обнуление количества повторений
 @app.post('/editCountResult')
-async def edit_count_result(result_id: int, new_count: int, db: AsyncSession = Depends(get_db)):
+async def edit_count_result(result_id: int, new_count: int, uow: UnitOfWork = Depends(get_uow)):
     try:
-        query = update(Results).where(Results.result_id == result_id).values(count = new_count, status = "✅")
-        await db.execute(query)
-        await db.commit()
+        await results_repo.edit_count(uow.session, result_id, new_count)
+        await uow.commit()
         return "Результат повторений обновлен"
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
+
+# Количество повторений у многих результатов сразу: {result_id: count}.
+# Один UPDATE и один коммит вместо запроса на каждый результат
+@app.post('/editCountResults')
+async def edit_count_results(counts: dict[int, int], uow: UnitOfWork = Depends(get_uow)):
+    try:
+        rows = await results_repo.edit_counts(uow.session, counts)
+        await uow.commit()
+        return {"updated": len(rows)}
+    except Exception as e:
+        return error_response("Произошла ошибка при обновлении", e)
     
 # Удаление результата пользователя
 @app.delete('/deleteResult')
-async def delete_result(result_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_result(result_id: int, uow: UnitOfWork = Depends(get_uow)):
     try:
-        query = delete(Results).where(Results.result_id == result_id)
-        await db.execute(query)
-        await db.commit()
+        await results_repo.delete_res(uow.session, result_id)
+        await uow.commit()
         return "Результат удален"
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
     
 # Выборка всех результатов определённого пользователя
-@app.get('/getUserAll')
-async def get_user_all(telegram_id: int, db: AsyncSession = Depends(get_db)):
+@app.get('/getUserAll', response_model = list[ResultOut])
+async def get_user_all(telegram_id: int, after_id: int | None = Query(None, ge = 0), limit: int | None = Query(None, ge = 1), stream: bool = False, db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Results).where(Results.telegram_id == telegram_id)
-        result = await db.execute(query)
-        return result.scalars().all()
+        query = keyset(results_repo.list_query(telegram_id = telegram_id), Results.result_id, after_id, limit)
+        if stream:
+            return ndjson_response(query)
+        results = (await db.execute(query)).all()
+        response = json_response(as_dicts(results))
+        set_next_after(response, results, "result_id", limit)
+        return response
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
     
 # Выборка результата пользователя по определённому соревнованию
-@app.get('/getUserResult')
-async def get_user_result(telegram_id: int, competition_id: int, db: AsyncSession = Depends(get_db)):
+@app.get('/getUserResult', response_model = ResultOut | None)
+async def get_user_result(telegram_id: int, competition_id: int, db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Results).where(and_(Results.telegram_id == telegram_id, Results.competition_id == competition_id))
-        result = await db.execute(query)
-        return result.scalar()
+        return json_response(as_dict(await results_repo.get_user(db, competition_id, telegram_id)))
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
     
 # Выборка всех результатов из БД
-@app.get('/getAllResult')
-async def get_all_result(db: AsyncSession = Depends(get_db)):
+@app.get('/getAllResult', response_model = list[ResultOut])
+async def get_all_result(after_id: int | None = Query(None, ge = 0), limit: int | None = Query(None, ge = 1), stream: bool = False, db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Results)
-        result = await db.execute(query)
-        return result.scalars().all()
+        query = keyset(results_repo.list_query(), Results.result_id, after_id, limit)
+        if stream:
+            return ndjson_response(query)
+        results = (await db.execute(query)).all()
+        response = json_response(as_dicts(results))
+        set_next_after(response, results, "result_id", limit)
+        return response
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
     
 # Выборка всех результатов определённого соревнования
-@app.get('/getCompetitionResult')
-async def get_competition_result(competition_id: int, db: AsyncSession = Depends(get_db)):
+@app.get('/getCompetitionResult', response_model = list[ResultOut])
+async def get_competition_result(competition_id: int, after_id: int | None = Query(None, ge = 0), limit: int | None = Query(None, ge = 1), stream: bool = False, db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Results).where(Results.competition_id == competition_id)
-        result = await db.execute(query)
-        return result.scalars().all()
+        query = keyset(results_repo.list_query(competition_id = competition_id), Results.result_id, after_id, limit)
+        if stream:
+            return ndjson_response(query)
+        results = (await db.execute(query)).all()
+        response = json_response(as_dicts(results))
+        set_next_after(response, results, "result_id", limit)
+        return response
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
     
 # Выборка id всех участников определённого соревнования
 @app.get('/getCompetitionMembers')
-async def get_competition_Members(competition_id: int, db: AsyncSession = Depends(get_db)):
+async def get_competition_Members(competition_id: int, db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Results.telegram_id).where(Results.competition_id == competition_id)
-        result = await db.execute(query)
-        return result.scalars().all()
+        return await results_repo.competition_members(db, competition_id)
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
 
 # Выборка статуса
 @app.get('/chekStatus')
-async def check_status(competition_id: int, telegram_id: int, db: AsyncSession = Depends(get_db)):
+async def check_status(competition_id: int, telegram_id: int, db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Results.status).where(and_(Results.competition_id == competition_id,Results.telegram_id == telegram_id))
-        result = await db.execute(query)
-        return result.scalars().all()
+        return await cache.fetch(status_key(competition_id, telegram_id),
+                                 lambda: results_repo.check_status(db, competition_id, telegram_id))
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
 
 # Фильтрация результатов соревнования по count от большего к меньшему
-@app.get('/raitingUsers')
-async def rating_users(competition_id: int, db: AsyncSession = Depends(get_db)):
+@app.get('/raitingUsers', response_model = list[ResultOut])
+async def rating_users(competition_id: int, offset: int = Query(0, ge = 0), limit: int | None = Query(None, ge = 1), db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Results).where(Results.competition_id == competition_id).filter(Results.count != null()).order_by(desc(Results.count))
-        result = await db.execute(query)
-        return result.scalars().all()
+        page = leaderboards.competition_page(competition_id, offset, limit)
+        return json_response(as_dicts(await results_repo.load(db, [result_id for result_id, count in page])))
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при добавлении", e)
     
 # Фильтрация результатов соревнования по count от большего к меньшему
 @app.get('/totalRaitingUsers')
-async def total_rating_users(db: AsyncSession = Depends(get_db)):
+async def total_rating_users(offset: int = Query(0, ge = 0), limit: int | None = Query(None, ge = 1)):
+    try:
+        return [telegram_id for telegram_id, total_count in leaderboards.total_page(offset, limit)]
+    except Exception as e:
+        return error_response("Произошла ошибка при добавлении", e)
+
+# Место юзера в рейтинге соревнования
+@app.get('/userRank')
+async def user_rank(competition_id: int, telegram_id: int):
+    rank = leaderboards.competition_rank(competition_id, telegram_id)
+    if rank is None:
+        return None
+    return {"rank": rank[0], "count": rank[1], "members": leaderboards.competition_size(competition_id)}
+
+# Место юзера в общем рейтинге
+@app.get('/totalUserRank')
+async def total_user_rank(telegram_id: int):
+    rank = leaderboards.total_rank(telegram_id)
+    if rank is None:
+        return None
+    return {"rank": rank[0], "total_count": rank[1], "members": len(leaderboards.total)}
+
+# Сводка по соревнованию: участники, проверенные и ожидающие результаты,
+# сумма и среднее повторений. Берётся из памяти, без запроса к БД
+@app.get('/competitionStats')
+async def get_competition_stats(competition_id: int):
+    return competition_stats.get(competition_id)
+
+# Участвует ли юзер в соревновании (вместо выборки всех участников)
+@app.get('/isCompetitionMember')
+async def is_competition_member(competition_id: int, telegram_id: int):
+    return competition_stats.is_member(competition_id, telegram_id)
+
+# Сверка сводок в памяти со сводкой, посчитанной по таблице results.
+# Расхождения появляются, если таблицу меняли в обход сервера (или другой
+# процесс); с rebuild=true рейтинги и сводки перечитываются из БД.
+# Записи, идущие во время сверки, тоже могут дать расхождение - тогда стоит повторить
+@app.get('/checkCompetitionStats')
+async def check_competition_stats(rebuild: bool = False, db: AsyncSession = Depends(get_read_db)):
     try:
-        query = select(Results.telegram_id, func.sum(Results.count).label('total_count')).filter(Results.status.isnot(None), Results.count > 0).group_by(Results.telegram_id).order_by(func.sum(Results.count).desc())
-        result = await db.execute(query)
-        return result.scalars().all()
+        mismatches = competition_stats.diff(await results_repo.competition_summary(db, VERIFIED))
+        if mismatches and rebuild:
+            await load_leaderboards()
+        return {"ok": not mismatches, "mismatches": mismatches, "rebuilt": bool(mismatches and rebuild)}
     except Exception as e:
-        return {"error": f"Произошла ошибка при добавлении: {str(e)}"}
+        return error_response("Произошла ошибка при проверке", e)
     
+
+
+
+# Массовая загрузка: строк в одном INSERT (и в одной транзакции)
+BULK_CHUNK = 500
+
+# Строки из тела запроса с номерами: JSON-массив, либо поток NDJSON или CSV
+# (по Content-Type). Вместо строки, которую не удалось разобрать, отдаётся исключение
+async def read_rows(request: Request):
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "csv" not in content_type:
+        try:
+            body = await request.json()
+        except ValueError as e:
+            raise HTTPException(status_code = 422, detail = f"Неверный JSON: {e}")
+        if not isinstance(body, list):
+            raise HTTPException(status_code = 422, detail = "Ожидается JSON-массив")
+        for number, row in enumerate(body, 1):
+            yield number, row
+        return
+
+    async def lines():
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        tail = ""
+        async for chunk in request.stream():
+            parts = (tail + decoder.decode(chunk)).split("\n")
+            tail = parts.pop()
+            for line in parts:
+                yield line
+        yield tail + decoder.decode(b"", final = True)
+
+    header = None
+    number = 0
+    async for line in lines():
+        line = line.rstrip("\r")
+        if not line.strip():
+            continue
+        if "csv" in content_type and header is None:
+            header = next(csv.reader([line]))
+            continue
+        number += 1
+        try:
+            yield number, (dict(zip(header, next(csv.reader([line])))) if header is not None else json.loads(line))
+        except ValueError as e:
+            yield number, e
+
+# Запись строк пачками по BULK_CHUNK в отдельных транзакциях. Если пачка не
+# записалась целиком, её строки пишутся по одной, чтобы найти ошибочные.
+# save(session, rows) - функция репозитория, которая пишет пачку
+async def bulk_write(rows, schema, save):
+    report = {"saved": 0, "errors": []}
+
+    async def write(chunk):
+        try:
+            async with unit_of_work() as uow:
+                await save(uow.session, [values for _, values in chunk])
+                await uow.commit()
+            report["saved"] += len(chunk)
+            return
+        except Exception:
+            if len(chunk) == 1:
+                raise
+        for item in chunk:
+            try:
+                await write([item])
+            except Exception as e:
+                report["errors"].append({"row": item[0], "error": str(e)})
+
+    chunk = []
+    async for number, row in rows:
+        try:
+            if isinstance(row, Exception):
+                raise row
+            chunk.append((number, schema(**row).model_dump()))
+        except (ValidationError, ValueError, TypeError) as e:
+            report["errors"].append({"row": number, "error": str(e)})
+        if len(chunk) >= BULK_CHUNK:
+            await write(chunk)
+            chunk = []
+    if chunk:
+        await write(chunk)
+    return report
+
+# Массовое добавление (или обновление) юзеров
+@app.post('/bulkUsers')
+async def bulk_users(request: Request):
+    try:
+        return await bulk_write(read_rows(request), UserBase, users_repo.upsert_many)
+    except Exception as e:
+        return error_response("Произошла ошибка при загрузке", e)
+
+# Массовое добавление результатов; результат юзера в соревновании обновляется
+@app.post('/bulkResults')
+async def bulk_results(request: Request):
+    try:
+        return await bulk_write(read_rows(request), ResultsBase, results_repo.upsert_many)
+    except Exception as e:
+        return error_response("Произошла ошибка при загрузке", e)
+
+# Выгрузка юзеров для резервной копии (format: ndjson или csv)
+@app.get('/exportUsers')
+async def export_users(format: str = "ndjson"):
+    query = users_repo.list_query().order_by(Users.telegram_id)
+    return csv_response(query) if format == "csv" else ndjson_response(query)
+
+# Выгрузка результатов для резервной копии (format: ndjson или csv)
+@app.get('/exportResults')
+async def export_results(format: str = "ndjson"):
+    query = results_repo.list_query().order_by(Results.result_id)
+    return csv_response(query) if format == "csv" else ndjson_response(query)
+
+# Статистика кэша частых запросов
+@app.get('/cacheStats')
+async def cache_stats():
+    return cache.stats()
+
+metrics.Gauge("cache_lookups_total", "Обращения к кэшу частых запросов", ("result",),
+              lambda: {("hit",): cache.hits - cache.negative_hits, ("negative_hit",): cache.negative_hits,
+                       ("miss",): cache.misses}, kind = "counter")
+metrics.Gauge("leaderboard_results", "Результаты в рейтингах в памяти", (),
+              lambda: {(): len(leaderboards)})
+metrics.Gauge("competition_stats_competitions", "Соревнования со сводкой в памяти", (),
+              lambda: {(): len(competition_stats)})
+
+# Метрики в формате Prometheus
+@app.get('/metrics')
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type = "text/plain; version=0.0.4")